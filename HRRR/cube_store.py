@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+HEADER_FILE = "cube_header.json"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cube_path(folder, short_name):
+    return os.path.join(folder, f"{short_name}.npy")
+
+
+def write_cube_store(folder, levels_params, levels, window, units, source_path, lats=None, lons=None):
+    """Write one (level, y, x) float32 .npy cube per parameter plus a JSON header.
+
+    levels_params maps level -> {short_name: 2D window array}. The header
+    records the levels (in cube order), the grid window, units and the hash
+    of the source file.
+    """
+    levels = sorted(levels)
+    short_names = list(units)
+    if not levels:
+        raise ValueError(f"No level of {os.path.basename(source_path)} has all of {short_names}; "
+                         "nothing to write (subset download or missing variable?)")
+    os.makedirs(folder, exist_ok=True)
+    ny, nx = levels_params[levels[0]][short_names[0]].shape
+    for short_name in short_names:
+        # Fill the cube on disk one level at a time
+        cube = np.lib.format.open_memmap(cube_path(folder, short_name), mode="w+",
+                                         dtype=np.float32, shape=(len(levels), ny, nx))
+        for k, level in enumerate(levels):
+            cube[k] = levels_params[level][short_name]
+        cube.flush()
+        del cube
+    if lats is not None and lons is not None:
+        np.save(os.path.join(folder, "latitudes.npy"), lats)
+        np.save(os.path.join(folder, "longitudes.npy"), lons)
+    header = {
+        "levels": [int(level) for level in levels],
+        "shape": [len(levels), int(ny), int(nx)],
+        "dtype": "float32",
+        "window": _window_dict(window),
+        "units": dict(units),
+        "source_file": os.path.basename(source_path),
+        "source_sha256": file_sha256(source_path),
+    }
+    _write_header(folder, header)
+    return header
+
+
+def create_time_cubes(folder, short_names, n_times, n_levels, window):
+    """Create one empty (time, level, y, x) float32 .npy cube per parameter, memory-mapped for writing.
+
+    Cells that are never written stay NaN.
+    """
+    os.makedirs(folder, exist_ok=True)
+    ny = window[0].stop - window[0].start
+    nx = window[1].stop - window[1].start
+    cubes = {}
+    for short_name in short_names:
+        cube = np.lib.format.open_memmap(cube_path(folder, short_name), mode="w+",
+                                         dtype=np.float32, shape=(n_times, n_levels, ny, nx))
+        cube[:] = np.nan
+        cubes[short_name] = cube
+    return cubes
+
+
+def write_time_header(folder, forecast_hours, valid_times, levels, window, units, source_paths, lats=None, lons=None):
+    """Write the JSON header (and window lat/lon) for a (time, level, y, x) cube store."""
+    if lats is not None and lons is not None:
+        np.save(os.path.join(folder, "latitudes.npy"), lats)
+        np.save(os.path.join(folder, "longitudes.npy"), lons)
+    ny = window[0].stop - window[0].start
+    nx = window[1].stop - window[1].start
+    header = {
+        "forecast_hours": [int(fxx) for fxx in forecast_hours],
+        "valid_times": list(valid_times),
+        "levels": [int(level) for level in levels],
+        "shape": [len(forecast_hours), len(levels), int(ny), int(nx)],
+        "dtype": "float32",
+        "window": _window_dict(window),
+        "units": dict(units),
+        "sources": [{"file": os.path.basename(path), "sha256": file_sha256(path)} for path in source_paths],
+    }
+    _write_header(folder, header)
+    return header
+
+
+def _window_dict(window):
+    return {
+        "row_start": int(window[0].start), "row_stop": int(window[0].stop),
+        "col_start": int(window[1].start), "col_stop": int(window[1].stop),
+    }
+
+
+def _write_header(folder, header):
+    with open(os.path.join(folder, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+
+def read_header(folder):
+    with open(os.path.join(folder, HEADER_FILE)) as f:
+        return json.load(f)
+
+
+def open_cube(folder, short_name):
+    """Open a parameter cube memory-mapped read-only; slicing it doesn't copy the file.
+
+    Works for both (level, y, x) and (time, level, y, x) stores.
+    """
+    return np.load(cube_path(folder, short_name), mmap_mode="r")
+
+
+def level_index(header, level):
+    """Index of a model level along the first axis of the cubes."""
+    return header["levels"].index(int(level))
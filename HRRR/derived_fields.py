@@ -0,0 +1,48 @@
+import numpy as np
+
+# Constants for the omega -> w conversion
+R_D = 287.05  # J/kg·K
+G = 9.81      # m/s²
+
+
+def _output(out, like):
+    """Use the caller's preallocated output, or allocate a float32 array shaped like `like`."""
+    if out is None:
+        return np.empty(np.shape(like), dtype=np.float32)
+    return out
+
+
+def omega_to_w(omega, t, pres, out=None):
+    """Geometric vertical velocity w [m/s] from omega [Pa/s], temperature [K] and pressure [Pa].
+
+    w = -(omega * R_d * T) / (p * g), evaluated in place in `out` so no
+    full-size temporaries are created. Works on single levels or whole cubes.
+    """
+    out = _output(out, omega)
+    np.multiply(omega, t, out=out)
+    np.multiply(out, np.float32(-R_D / G), out=out)
+    np.divide(out, pres, out=out)
+    return out
+
+
+def horizontal_speed(u, v, out=None):
+    """Horizontal wind speed sqrt(u² + v²) [m/s]."""
+    out = _output(out, u)
+    return np.hypot(u, v, out=out)
+
+
+def wind_direction(u, v, out=None):
+    """Meteorological wind direction [deg], the direction the wind blows from (0 = north, 90 = east)."""
+    out = _output(out, u)
+    np.arctan2(u, v, out=out)
+    np.multiply(out, np.float32(180.0 / np.pi), out=out)
+    np.add(out, np.float32(180.0), out=out)
+    np.mod(out, np.float32(360.0), out=out)
+    return out
+
+
+def wind_magnitude(u, v, w, out=None):
+    """3D wind magnitude sqrt(u² + v² + w²) [m/s]."""
+    out = _output(out, u)
+    np.hypot(u, v, out=out)
+    return np.hypot(out, w, out=out)
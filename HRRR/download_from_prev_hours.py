@@ -1,9 +1,10 @@
 # WILL CHANGE this is to facilitate automated downloading of data from the previous hours
 
 import os
-import shutil  # To move the downloaded file
 from datetime import datetime, timedelta
 from herbie import Herbie
+from downloader import Downloader
+from grib_cache import GribCache
 
 # Define the base time as 8 hours ago
 base_time = datetime.utcnow() - timedelta(hours=24)
@@ -12,36 +13,53 @@ model = "hrrr"
 product = "sfc"  # Surface fields
 forecast_hours = range(0, 19)  # Forecast hours from f00 to f18
 
-# Define the desired folder for storing the data
-current_dir = os.getcwd()  # Get the current working directory
-data_folder = os.path.join(current_dir, "HRRRdata")  # Desired folder
-if not os.path.exists(data_folder):
-    os.makedirs(data_folder)
-    print(f"Created folder: {data_folder}")
-else:
-    print(f"Using existing folder: {data_folder}")
+# Files are stored in (and reused from) the shared GRIB cache
+cache = GribCache()
+print(f"Using GRIB cache: {os.path.abspath(cache.cache_dir)}")
 
 print(f"Starting from base time: {base_time_str}")
 
-# Loop through each forecast hour and download data
+# Resolve the GRIB2/.idx URLs of each forecast hour that isn't cached yet with Herbie
+jobs = []
+cached = 0
 for hour in forecast_hours:
     forecast_hour = f"f{hour:02d}"  # Format as f00, f01, ..., f18
-    print(f"Downloading HRRR data for {base_time_str}, forecast hour {forecast_hour}...")
-    
+    path = cache.lookup(model, product, base_time, hour)
+    if path is not None:
+        print(f"{forecast_hour} already cached: {path}")
+        cached += 1
+        continue
     try:
-        # Create a Herbie instance for the specific forecast hour
-        H = Herbie(base_time, model=model, product=product, fxx=hour)
-
-        # Download HRRR data to the default location (home directory)
-        grib_file = H.download()  # The file will initially download to the default Herbie directory
-        grib_file_path = str(grib_file)  # Ensure the path is a string
-        print(f"File downloaded to: {grib_file_path}")
-
-        # Move the downloaded file to the desired folder (HRRRdata)
-        destination_file_path = os.path.join(data_folder, os.path.basename(grib_file_path))  # Construct destination path
-        shutil.move(grib_file_path, destination_file_path)
-        print(f"File moved to: {destination_file_path}")
+        H = Herbie(base_time, model=model, product=product, fxx=hour, verbose=False)
+        jobs.append((hour, forecast_hour, H, cache.reserve(model, product, base_time, hour)))
     except Exception as e:
-        print(f"Failed to download data for {forecast_hour}: {e}")
+        print(f"Failed to find data for {forecast_hour}: {e}")
+
+# Download all hours concurrently through one pooled session: inventories
+# first, then the GRIB2 files, resumed and verified against their .idx
+downloader = Downloader(max_workers=4)
+print(f"Downloading {len(jobs)} forecast hours for {base_time_str}...")
+idx_results = downloader.fetch_all([{"url": H.idx, "dest": path + ".idx"} for _, _, H, path in jobs])
+grib_jobs = []
+for (_, forecast_hour, H, path), (idx_path, error) in zip(jobs, idx_results):
+    job = {"url": H.grib, "dest": path}
+    if error is None:
+        job["idx_path"] = idx_path
+    else:
+        print(f"Warning: Failed to fetch .idx file for {forecast_hour} ({error}), verifying size only")
+    grib_jobs.append(job)
 
-print("All requested HRRR forecast data downloaded successfully!")
+failed = 0
+for (hour, forecast_hour, _, _), (path, error) in zip(jobs, downloader.fetch_all(grib_jobs)):
+    if error is None:
+        cache.add(model, product, base_time, hour)
+        print(f"{forecast_hour} saved to: {path}")
+    else:
+        failed += 1
+        print(f"Failed to download data for {forecast_hour}: {error}")
+
+available = cached + len(jobs) - failed
+if available < len(forecast_hours):
+    print(f"Got {available}/{len(forecast_hours)} forecast hours. See messages above.")
+else:
+    print("All requested HRRR forecast data downloaded successfully!")
@@ -0,0 +1,148 @@
+import concurrent.futures
+import json
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cube_store import file_sha256
+from grib_index import parse_idx
+
+CHUNK_SIZE = 1 << 20
+GRIB_MAGIC = b"GRIB"
+
+
+def verify_against_idx(grib_path, idx_path):
+    """Check a downloaded GRIB2 file against its .idx inventory.
+
+    Every message offset listed in the inventory must fall inside the file
+    and start with the 'GRIB' magic bytes. Raises IOError otherwise.
+    """
+    entries = parse_idx(idx_path)
+    size = os.path.getsize(grib_path)
+    with open(grib_path, "rb") as f:
+        for entry in entries:
+            end = entry["offset"] + (entry["length"] or len(GRIB_MAGIC))
+            if end > size:
+                raise IOError(f"{grib_path} is truncated: message {entry['n']} ends at {end}, file has {size} bytes")
+            f.seek(entry["offset"])
+            if f.read(len(GRIB_MAGIC)) != GRIB_MAGIC:
+                raise IOError(f"{grib_path}: no GRIB message at offset {entry['offset']} (message {entry['n']})")
+
+
+class Downloader:
+    """Concurrent HTTP downloader sharing one pooled requests.Session.
+
+    Partial transfers are kept as `<dest>.part` and resumed with a Range
+    request; files are verified (size and optional SHA-256) before being
+    renamed into place atomically. `<dest>.part.json` records the URL (and
+    ETag/Last-Modified) a partial file came from, so only a transfer of the
+    same file is resumed (HRRR names carry no date).
+    """
+
+    def __init__(self, max_workers=4, retries=3, backoff=2.0, timeout=60):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Connection-level retries for failed connects and 5xx responses
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers,
+                              max_retries=Retry(total=retries, backoff_factor=backoff,
+                                                status_forcelist=[500, 502, 503, 504]))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url, dest, expected_size=None, sha256=None, idx_path=None):
+        """Download url to dest, resuming and retrying on errors. Returns dest.
+
+        expected_size / sha256 are checked when given; otherwise the size is
+        checked against the server's Content-Length. With idx_path, the file
+        is also checked against that .idx inventory.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                self._fetch_once(url, dest, expected_size, sha256, idx_path)
+                return dest
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2 ** attempt
+                print(f"\nWarning: {os.path.basename(dest)} attempt {attempt + 1} failed ({e}), retrying in {wait:.0f}s")
+                time.sleep(wait)
+
+    def fetch_all(self, jobs):
+        """Run fetch() for a list of job dicts concurrently.
+
+        Each job has 'url' and 'dest' plus optional fetch() keyword arguments.
+        Returns a list of (dest, error) in job order, error being None on success.
+        """
+        def run(job):
+            try:
+                return self.fetch(**job), None
+            except Exception as e:
+                return job["dest"], e
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, jobs))
+
+    def _fetch_once(self, url, dest, expected_size, sha256, idx_path):
+        part_path = dest + ".part"
+        source_path = part_path + ".json"
+        source = None
+        if os.path.exists(source_path):
+            with open(source_path) as f:
+                source = json.load(f)
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if have and (source is None or source["url"] != url
+                     or (expected_size is not None and have > expected_size)):
+            # Left over from another file (e.g. the same name of an earlier cycle)
+            os.remove(part_path)
+            have = 0
+        # Byte offsets and sizes only hold for the raw bytes, so no compressed transfer
+        headers = {"Accept-Encoding": "identity"}
+        if have:
+            headers["Range"] = f"bytes={have}-"
+            # The server sends the whole (new) file instead of a range if it changed
+            validator = source.get("etag") or source.get("last_modified")
+            if validator:
+                headers["If-Range"] = validator
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if have and response.status_code == 416:
+                # Nothing left to fetch: the partial file is already complete
+                total = have
+            else:
+                response.raise_for_status()
+                if have and response.status_code != 206:
+                    # Server ignored the Range header, or the file changed, and is sending the whole file
+                    have = 0
+                if not have:
+                    with open(source_path, "w") as f:
+                        json.dump({"url": url, "etag": response.headers.get("ETag"),
+                                   "last_modified": response.headers.get("Last-Modified")}, f)
+                content_length = response.headers.get("Content-Length")
+                total = have + int(content_length) if content_length is not None else None
+                with open(part_path, "ab" if have else "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+
+        size = os.path.getsize(part_path)
+        expected = expected_size if expected_size is not None else total
+        if expected is not None and size != expected:
+            # Keep the partial file so the next attempt resumes from it
+            raise IOError(f"{os.path.basename(dest)}: got {size} bytes, expected {expected}")
+        if sha256 is not None:
+            digest = file_sha256(part_path)
+            if digest != sha256:
+                os.remove(part_path)
+                raise IOError(f"{os.path.basename(dest)}: SHA-256 mismatch ({digest} != {sha256})")
+        if idx_path is not None:
+            try:
+                verify_against_idx(part_path, idx_path)
+            except IOError:
+                os.remove(part_path)
+                raise
+        os.replace(part_path, dest)
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
@@ -1,88 +1,78 @@
-import xarray as xr
+import netCDF4 as nc
 import numpy as np
 import os
+import sys
 from datetime import datetime
 
+# Level-at-a-time NetCDF reader shared with the NC_swaps scripts
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../NC_swaps"))
+from nc_levels import GROUPS, WIND_PARAMS, has_group, iter_levels, nearest_index, read_filled
+
 def print_point_comparison(hrrr_ds, of_ds, diff_ds, group, lat_val, lon_val, alt_val):
     """Print comparison of wind components at a specific point."""
     print(f"\n=== Wind Components Comparison for {group} group ===")
     print(f"Location: latitude: {lat_val:.4f}, longitude: {lon_val:.4f}, altitude: {alt_val:.1f}m")
-    
-    # Find nearest altitude index
-    alt_coords = hrrr_ds[f'altitude_{group}']
-    alt_idx = np.abs(alt_coords - alt_val).argmin()
-    actual_alt = float(alt_coords[alt_idx])
-    
+
+    # Find nearest altitude, latitude and longitude indices (only the coordinates are read)
+    alt_idx = nearest_index(read_filled(hrrr_ds, f'altitude_{group}'), alt_val)
+    datasets = [(ds, nearest_index(read_filled(ds, f'latitude_{group}'), lat_val),
+                 nearest_index(read_filled(ds, f'longitude_{group}'), lon_val))
+                for ds in (hrrr_ds, of_ds, diff_ds)]
+
     print("\nWind Components:")
     print(f"{'Component':<10} {'HRRR':>10} {'OpenFOAM':>10} {'Difference':>10}")
     print("-" * 42)
-    
-    for var in ['u', 'v', 'w']:
+
+    for var in WIND_PARAMS:
         var_name = f'{var}_{group}'
-        
-        # Get values from each dataset
-        hrrr_val = float(hrrr_ds[var_name].isel({f'altitude_{group}': alt_idx}).sel(
-            {f'latitude_{group}': lat_val, f'longitude_{group}': lon_val},
-            method='nearest'
-        ).values)
-        
-        of_val = float(of_ds[var_name].isel({f'altitude_{group}': alt_idx}).sel(
-            {f'latitude_{group}': lat_val, f'longitude_{group}': lon_val},
-            method='nearest'
-        ).values)
-        
-        diff_val = float(diff_ds[var_name].isel({f'altitude_{group}': alt_idx}).sel(
-            {f'latitude_{group}': lat_val, f'longitude_{group}': lon_val},
-            method='nearest'
-        ).values)
-        
+
+        # Get the point's value from each dataset
+        hrrr_val, of_val, diff_val = [float(read_filled(ds, var_name, (alt_idx, lat_idx, lon_idx)))
+                                      for ds, lat_idx, lon_idx in datasets]
+
         print(f"{var:<10} {hrrr_val:>10.4f} {of_val:>10.4f} {diff_val:>10.4f}")
 
-def create_diff_dataset(hrrr_ds, of_ds, group):
-    """Create a dataset containing differences between HRRR and OpenFOAM data for a specific group."""
-    diff_data = {}
-    
+def copy_variable(src, dst, name, attrs=None):
+    """Create a variable in dst like the one in src (dimensions included); returns it without data"""
+    var = src.variables[name]
+    for dim in var.dimensions:
+        if dim not in dst.dimensions:
+            dst.createDimension(dim, len(src.dimensions[dim]))
+    fill_value = var.getncattr('_FillValue') if '_FillValue' in var.ncattrs() else None
+    if np.issubdtype(var.dtype, np.floating) and fill_value is None:
+        fill_value = np.nan
+    out = dst.createVariable(name, var.dtype, var.dimensions, fill_value=fill_value, zlib=True)
+    out.setncatts({**{key: var.getncattr(key) for key in var.ncattrs() if key != '_FillValue'}, **(attrs or {})})
+    return out
+
+def write_diff_group(hrrr_ds, of_ds, diff_ds, group):
+    """Write the differences between HRRR and OpenFOAM data for a specific group, one level at a time."""
     # Copy coordinates and dimensions from OpenFOAM dataset
     for coord in [f'latitude_{group}', f'longitude_{group}', f'altitude_{group}',
                  f'x_from_origin_{group}', f'y_from_origin_{group}']:
-        if coord in of_ds:
-            diff_data[coord] = of_ds[coord].copy()
-    
-    # Calculate differences for u, v, w
-    for var in ['u', 'v', 'w']:
-        var_name = f'{var}_{group}'
-        hrrr_var = hrrr_ds[var_name].values
-        of_var = of_ds[var_name].values
-        
-        # Create difference array with same shape
-        diff = np.full_like(hrrr_var, np.nan)
-        
-        # Calculate difference where both arrays have valid data
-        valid_mask = ~np.isnan(hrrr_var) & ~np.isnan(of_var)
-        diff[valid_mask] = hrrr_var[valid_mask] - of_var[valid_mask]
-        
-        # Create DataArray with the difference data
-        diff_data[var_name] = xr.DataArray(
-            data=diff,
-            dims=of_ds[var_name].dims,  # Use OpenFOAM dimensions
-            coords=of_ds[var_name].coords,  # Use OpenFOAM coordinates
-            attrs=of_ds[var_name].attrs
-        )
-        
-        # Update attributes specific to the difference data
-        diff_data[var_name].attrs['description'] = f'Difference between HRRR and OpenFOAM {var} component (HRRR - OpenFOAM)'
-        diff_data[var_name].attrs['units'] = 'm/s'
-    
-    return diff_data
+        if coord in of_ds.variables:
+            copy_variable(of_ds, diff_ds, coord)[:] = of_ds.variables[coord][:]
+
+    diff_vars = {
+        var: copy_variable(of_ds, diff_ds, f'{var}_{group}', attrs={
+            'description': f'Difference between HRRR and OpenFOAM {var} component (HRRR - OpenFOAM)',
+            'units': 'm/s',
+        })
+        for var in WIND_PARAMS
+    }
+
+    # Only one level of each dataset is in memory at a time
+    for (k, _, hrrr_fields), (_, _, of_fields) in zip(iter_levels(hrrr_ds, group), iter_levels(of_ds, group)):
+        for var, diff_var in diff_vars.items():
+            # NaN wherever either dataset has no valid data
+            diff_var[k] = hrrr_fields[var] - of_fields[var]
 
 def main():
-    # Set random seed for reproducibility
-    np.random.seed(42)
-    
     # Input file paths
     hrrr_nc = "NCdata/hrrr-regrid_usa-tx-elizabethtown_2023-02-14T15-00-00_f0hr0min.nc"
     of_nc = "NCdata/openfoam_usa-tx-elizabethtown_2023-02-14T15-00-00.nc"
-    
+
     # Check if input files exist
     if not (os.path.exists(hrrr_nc) and os.path.exists(of_nc)):
         print("Error: One or both input NetCDF files not found.")
@@ -90,62 +80,46 @@ def main():
         print(f"  - {os.path.abspath(hrrr_nc)}")
         print(f"  - {os.path.abspath(of_nc)}")
         return
-    
-    # Open datasets
-    hrrr_ds = xr.open_dataset(hrrr_nc)
-    of_ds = xr.open_dataset(of_nc)
-    
+
     # Extract datetime from HRRR filename for consistency
     datetime_str = "2023-02-14T15-00-00"  # From the source filename
-    
+
     # Create output filename matching source format
     output_nc = f"NCdata/diff_hrr_cfd_usa-tx-elizabethtown_{datetime_str}.nc"
-    
-    # Initialize empty dictionary for all differences
-    all_diff_data = {}
-    
-    # Process each group (low, mid, high)
-    for group in ['low', 'mid', 'high']:
-        print(f"\n=== Processing {group} group ===")
-        
-        # Calculate differences
-        diff_data = create_diff_dataset(hrrr_ds, of_ds, group)
-        all_diff_data.update(diff_data)
-        
-        # Create temporary dataset for differences
-        temp_ds = xr.Dataset(diff_data)
-        
-        # Print comparison at specific points
-        if group == 'low':
-            points = [(33.0287, -97.2751, 420.0)]
-        elif group == 'mid':
-            points = [(33.0287, -97.2751, 600.0)]
-        else:  # high
-            points = [(33.0287, -97.2751, 800.0)]
-            
-        for lat, lon, alt in points:
-            print_point_comparison(hrrr_ds, of_ds, temp_ds, group, lat, lon, alt)
-    
-    # Create new dataset with differences
-    diff_ds = xr.Dataset(all_diff_data)
-    
-    # Copy global attributes from HRRR dataset
-    diff_ds.attrs = hrrr_ds.attrs.copy()
-    diff_ds.attrs['description'] = 'Difference between HRRR and OpenFOAM data (HRRR - OpenFOAM)'
-    diff_ds.attrs['created'] = datetime_str
-    diff_ds.attrs['hrrr_source'] = os.path.basename(hrrr_nc)
-    diff_ds.attrs['openfoam_source'] = os.path.basename(of_nc)
-    
-    # Save to netCDF file
     print(f"\nSaving differences to: {output_nc}")
-    diff_ds.to_netcdf(output_nc)
-    
-    # Close datasets
-    hrrr_ds.close()
-    of_ds.close()
-    diff_ds.close()
-    
+
+    with nc.Dataset(hrrr_nc) as hrrr_ds, nc.Dataset(of_nc) as of_ds, nc.Dataset(output_nc, 'w') as diff_ds:
+        # Copy global attributes from HRRR dataset
+        diff_ds.setncatts({key: hrrr_ds.getncattr(key) for key in hrrr_ds.ncattrs()})
+        diff_ds.setncatts({
+            'description': 'Difference between HRRR and OpenFOAM data (HRRR - OpenFOAM)',
+            'created': datetime_str,
+            'hrrr_source': os.path.basename(hrrr_nc),
+            'openfoam_source': os.path.basename(of_nc),
+        })
+
+        # Process each group (low, mid, high)
+        for group in GROUPS:
+            print(f"\n=== Processing {group} group ===")
+            if not (has_group(hrrr_ds, group) and has_group(of_ds, group)):
+                print(f"  Skipping {group}: missing in one of the datasets")
+                continue
+
+            # Calculate differences
+            write_diff_group(hrrr_ds, of_ds, diff_ds, group)
+
+            # Print comparison at specific points
+            if group == 'low':
+                points = [(33.0287, -97.2751, 420.0)]
+            elif group == 'mid':
+                points = [(33.0287, -97.2751, 600.0)]
+            else:  # high
+                points = [(33.0287, -97.2751, 800.0)]
+
+            for lat, lon, alt in points:
+                print_point_comparison(hrrr_ds, of_ds, diff_ds, group, lat, lon, alt)
+
     print("Done! Difference file created successfully.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,115 @@
+import io
+import os
+import time
+import numpy as np
+from datetime import datetime
+from PIL import Image
+from cube_store import open_cube, read_header
+from derived_fields import omega_to_w
+from hrrr_grid import bbox_window
+from image_encoding import ENCODINGS, encode_masked_rgba, mask_pixels, split_hi_lo
+from temporal_encoding import (delta_decode, delta_encode, dequantize, encode_frames, frame_types, read_animation,
+                               write_animation)
+
+# Encode the (time, level, y, x) cubes of extract_forecast_hours.py into one
+# animation per level: a keyframe plus residual frames, all quantized with
+# fixed per-level ranges (temporal_encoding.py)
+
+# File paths
+DATA_FOLDER = "HRRRdata_nat"
+CYCLE = "2023-02-14T15:00:00"  # ISO format, UTC, as in extract_forecast_hours.py
+
+# Fort Worth bounding box (lon_min, lat_min, lon_max, lat_max)
+FORT_WORTH_BBOX = (-97.648, 32.742, -96.898, 33.231)
+
+# 8: one RGBA PNG per frame; 16: hi-byte/lo-byte PNG pairs (see image_encoding.py)
+ENCODING_BITS = 8
+# A full keyframe every this many frames so clients can seek (0: only the first frame)
+KEYFRAME_INTERVAL = 0
+
+
+def png_sizes_and_decode_time(images, bits):
+    """Total PNG bytes of images and the time to decode them all again, without writing files."""
+    blobs = []
+    for image in images:
+        for part in (split_hi_lo(image) if bits == 16 else [image]):
+            buf = io.BytesIO()
+            Image.fromarray(part, mode='RGBA').save(buf, format="PNG")
+            blobs.append(buf.getvalue())
+    start = time.perf_counter()
+    for blob in blobs:
+        np.asarray(Image.open(io.BytesIO(blob)))
+    return sum(map(len, blobs)), time.perf_counter() - start
+
+
+def main():
+    cycle = datetime.fromisoformat(CYCLE)
+    cube_folder = os.path.join(DATA_FOLDER, "levels_extracted", f"cubes_{cycle:%Y%m%d}_t{cycle:%H}z")
+    output_folder = os.path.join(DATA_FOLDER, "levels_extracted", f"animation_{cycle:%Y%m%d}_t{cycle:%H}z")
+    os.makedirs(output_folder, exist_ok=True)
+
+    header = read_header(cube_folder)
+    cubes = {short_name: open_cube(cube_folder, short_name) for short_name in ("u", "v", "w", "t", "pres", "gh")}
+    lats = np.load(os.path.join(cube_folder, "latitudes.npy"))
+    lons = np.load(os.path.join(cube_folder, "longitudes.npy"))
+    # The cubes hold the bbox window; the bbox mask inside it is recomputed from its lat/lon
+    mask = np.zeros(lats.shape, dtype=bool)
+    inner_window, inner_mask = bbox_window(lats, lons, FORT_WORTH_BBOX)
+    mask[inner_window] = inner_mask
+    pixels = mask_pixels(mask)
+    num_lat, num_lon = pixels[2]
+    frame_labels = [f"f{fxx:02d}" for fxx in header["forecast_hours"]]
+    print(f"Encoding {len(header['levels'])} levels x {len(frame_labels)} forecast hours from {cube_folder}")
+
+    delta_bytes = full_bytes = 0
+    delta_decode_time = full_decode_time = 0.0
+    for k, level in enumerate(header["levels"]):
+        # (time, masked points) series of this level
+        series = {short_name: cube[:, k][:, mask] for short_name, cube in cubes.items()}
+        w_geom = omega_to_w(series["w"], series["t"], series["pres"])
+        frames, ranges = encode_frames(series["u"], series["v"], w_geom, series["gh"], pixels, ENCODING_BITS)
+        meta = {
+            "level": int(level),
+            "forecast_hours": header["forecast_hours"],
+            "valid_times": header["valid_times"],
+            "min_lat": float(np.min(lats[mask])), "max_lat": float(np.max(lats[mask])),
+            "min_lon": float(np.min(lons[mask])), "max_lon": float(np.max(lons[mask])),
+            "num_lat": int(num_lat), "num_lon": int(num_lon),
+        }
+        # A holds gh, named gh_min/gh_max like in the level meta files
+        paths = write_animation(frames, ranges, meta, output_folder, f"fort_worth_level{level}", frame_labels,
+                                ENCODING_BITS, KEYFRAME_INTERVAL, alpha_name="gh")
+
+        # Decode what was written and check it against the frames and the cube values
+        decoded, decoded_ranges, _ = read_animation(paths[-1])
+        if not np.array_equal(decoded, frames):
+            raise ValueError(f"Decoded frames of level {level} don't match the encoded frames")
+        values = dequantize(decoded, decoded_ranges, ENCODING_BITS)
+        step = (ranges["u"][1] - ranges["u"][0]) / (65535 if ENCODING_BITS == 16 else 255)
+        u_err = np.nanmax(np.abs(values[:, pixels[0], pixels[1], 0] - series["u"]))
+        if u_err > step * 1.001:
+            raise ValueError(f"Decoded u of level {level} is off by {u_err}, more than one step ({step})")
+
+        # Payload and decode time (in memory) against independent, per-frame normalized images
+        encoded = delta_encode(frames, KEYFRAME_INTERVAL)
+        size, decode_time = png_sizes_and_decode_time(encoded, ENCODING_BITS)
+        start = time.perf_counter()
+        delta_decode(encoded, frame_types(len(frames), KEYFRAME_INTERVAL))
+        delta_decode_time += decode_time + time.perf_counter() - start
+        independent = [encode_masked_rgba(series["u"][t], series["v"][t], w_geom[t], series["gh"][t], pixels,
+                                          ENCODING_BITS)[0] for t in range(len(frames))]
+        full_size, full_time = png_sizes_and_decode_time(independent, ENCODING_BITS)
+        delta_bytes += size
+        full_bytes += full_size
+        full_decode_time += full_time
+        print(f"  Level {level}: {len(paths) - 1} images, {size / 1024:.0f} KB "
+              f"(independent frames: {full_size / 1024:.0f} KB)")
+
+    print(f"Saved animations to {output_folder} ({ENCODINGS[ENCODING_BITS]['encoding']})")
+    print(f"Payload: {delta_bytes / 1e6:.2f} MB vs {full_bytes / 1e6:.2f} MB for independent frames "
+          f"({full_bytes / max(delta_bytes, 1):.1f}x smaller)")
+    print(f"Decode: {delta_decode_time:.2f}s (PNG + residuals) vs {full_decode_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
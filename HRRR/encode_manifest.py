@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Each output folder keeps a manifest of the artifacts written there: for every
+# artifact (a level image + meta file, or an atlas), the digest of its inputs and
+# the files it produced. An artifact whose digest is unchanged and whose files
+# are all still there doesn't need to be written again.
+MANIFEST_FILE = "encode_manifest.json"
+# Part of every digest; bump it when the encoding itself changes so everything is rewritten
+ENCODER_VERSION = 1
+
+
+def content_digest(arrays, settings):
+    """SHA-256 of the input arrays (dtype, shape and bytes) and a JSON-able dict of encoder settings."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"encoder_version": ENCODER_VERSION, **settings}, sort_keys=True, default=str).encode())
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(f"{arr.dtype.str}{arr.shape}".encode())
+        h.update(arr.data)
+    return h.hexdigest()
+
+
+def load_manifest(folder):
+    """Artifact name -> {"digest", "outputs"} of a folder, empty if it has no manifest yet."""
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["artifacts"]
+
+
+def save_manifest(folder, artifacts):
+    """Write the manifest atomically, so an interrupted run never leaves it half written."""
+    path = os.path.join(folder, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"encoder_version": ENCODER_VERSION, "artifacts": artifacts}, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def is_current(entry, folder, digest):
+    """True if a manifest entry has this digest and all its output files exist in folder."""
+    return (entry is not None and entry["digest"] == digest
+            and all(os.path.exists(os.path.join(folder, name)) for name in entry["outputs"]))
+
+
+def manifest_entry(digest, paths):
+    return {"digest": digest, "outputs": [os.path.basename(path) for path in paths]}
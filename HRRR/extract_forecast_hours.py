@@ -0,0 +1,117 @@
+import numpy as np
+import os
+from datetime import datetime, timedelta
+from cube_store import create_time_cubes, write_time_header
+from grib_cache import GribCache
+from grib_index import find_idx, parse_idx, select_messages
+from hrrr_grid import grid_from_grib
+from parallel_decode import decode_parallel
+
+# Batch-extract every forecast hour of one cycle into a (time, level, y, x)
+# cube per parameter, e.g. the f02-f07 files fetched by hrrr_nat_download.py
+
+# File paths
+DATA_FOLDER = "HRRRdata_nat"
+CYCLE = "2023-02-14T15:00:00"  # ISO format, UTC
+FORECAST_HOURS = range(2, 8)  # f02 to f07
+
+# Parameters of interest
+PARAMS = {
+    "pres": "Pressure",
+    "gh": "Geopotential height",
+    "t": "Temperature",
+    "u": "U component of wind",
+    "v": "V component of wind",
+    "w": "Vertical velocity"
+}
+
+# Define units for each parameter
+PARAM_UNITS = {
+    "pres": "Pa",
+    "gh": "gpm",
+    "t": "K",
+    "u": "m/s",
+    "v": "m/s",
+    "w": "Pa/s"
+}
+
+# Fort Worth bounding box (lon_min, lat_min, lon_max, lat_max)
+FORT_WORTH_BBOX = (-97.648, 32.742, -96.898, 33.231)
+
+# Number of processes decoding GRIB messages
+WORKERS = os.cpu_count() or 1
+
+
+def grib_path_for(cycle, fxx, cache):
+    """Path of the wrfnat file for a cycle and forecast hour.
+
+    Taken from the GRIB cache if it holds PARAMS for that hour (on any levels,
+    e.g. a subset download), else the file in DATA_FOLDER with Herbie's naming.
+    """
+    cached = cache.lookup("hrrr", "nat", cycle, fxx, PARAMS)
+    if cached is not None:
+        return cached
+    return os.path.join(DATA_FOLDER, f"hrrr.t{cycle:%H}z.wrfnatf{fxx:02d}.grib2")
+
+
+def complete_levels(selected):
+    """Levels that have every parameter in PARAMS among the selected idx entries."""
+    have = {}
+    for entry in selected:
+        have.setdefault(entry["level_num"], set()).add(entry["short_name"])
+    return {level for level, names in have.items() if names >= set(PARAMS)}
+
+
+def main():
+    cycle = datetime.fromisoformat(CYCLE)
+    output_folder = os.path.join(DATA_FOLDER, "levels_extracted", f"cubes_{cycle:%Y%m%d}_t{cycle:%H}z")
+
+    # Collect the files of the cycle that have an .idx inventory
+    files = []
+    cache = GribCache()
+    for fxx in FORECAST_HOURS:
+        grib_path = grib_path_for(cycle, fxx, cache)
+        idx_path = find_idx(grib_path)
+        if not os.path.exists(grib_path) or idx_path is None:
+            print(f"Warning: skipping f{fxx:02d}, {grib_path} or its .idx not found")
+            continue
+        files.append((fxx, grib_path, select_messages(parse_idx(idx_path), PARAMS)))
+    if not files:
+        raise FileNotFoundError(f"No GRIB2 files with .idx found for cycle {cycle:%Y-%m-%d %H}z in {DATA_FOLDER}")
+
+    # Only keep levels with all parameters in every forecast hour
+    levels = sorted(set.intersection(*(complete_levels(selected) for _, _, selected in files)))
+    print(f"Forecast hours: {[fxx for fxx, _, _ in files]}")
+    print(f"Valid levels with all parameters: {levels}")
+
+    # One grid-geometry and crop computation shared by every forecast hour
+    grid = grid_from_grib(files[0][1])
+    window, mask = grid.bbox_window(FORT_WORTH_BBOX)
+    lats, lons = grid.latlons(window)
+
+    # Decode the messages of all files together in one process pool
+    tasks = []
+    targets = []
+    for t, (fxx, grib_path, selected) in enumerate(files):
+        for entry in selected:
+            if entry["level_num"] in levels:
+                tasks.append((grib_path, entry))
+                targets.append((entry["short_name"], t, levels.index(entry["level_num"])))
+    print(f"Decoding {len(tasks)} messages from {len(files)} files with {WORKERS} workers")
+    windows = decode_parallel(tasks, window, WORKERS)
+
+    cubes = create_time_cubes(output_folder, PARAMS, len(files), len(levels), window)
+    for (short_name, t, k), arr in zip(targets, windows):
+        cubes[short_name][t, k] = arr
+    for short_name, cube in cubes.items():
+        cube.flush()
+        print(f"  Saved {short_name}.npy, shape: {cube.shape}, min: {np.nanmin(cube)}, max: {np.nanmax(cube)}")
+    del cubes
+
+    valid_times = [(cycle + timedelta(hours=fxx)).isoformat() for fxx, _, _ in files]
+    write_time_header(output_folder, [fxx for fxx, _, _ in files], valid_times, levels, window,
+                      PARAM_UNITS, [grib_path for _, grib_path, _ in files], lats, lons)
+    print(f"Time-stacked cubes saved in {output_folder}")
+
+if __name__ == "__main__":
+    main()
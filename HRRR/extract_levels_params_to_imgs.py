@@ -1,9 +1,13 @@
-import pygrib
 import numpy as np
 import os
 import pandas as pd
-from PIL import Image
 import json
+from derived_fields import omega_to_w
+from grib_cache import resolve_grib_path
+from hrrr_extract import extract_window_levels
+from encode_manifest import content_digest, is_current, load_manifest, manifest_entry, save_manifest
+from image_encoding import ENCODINGS, encode_masked_rgba, mask_pixels, save_encoded_png
+from texture_atlas import write_atlas
 
 # File paths
 DATA_FOLDER = "HRRRdata_nat"
@@ -25,7 +29,14 @@ FORT_WORTH_BBOX = (-97.648, 32.742, -96.898, 33.231)
 
 # Output folder for images
 OUTPUT_FOLDER = os.path.join(DATA_FOLDER, "levels_extracted_img_encoded")
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# 8: one RGBA PNG per level; 16: 16 bits per channel as a hi-byte/lo-byte PNG pair
+ENCODING_BITS = 8
+# True: all levels in one fort_worth_atlas.png + fort_worth_atlas_manifest.json
+# instead of an image and meta file per level (see texture_atlas.py)
+ATLAS = False
+
+# Number of processes decoding GRIB messages (1 decodes serially)
+WORKERS = os.cpu_count() or 1
 
 # Define units for each parameter
 PARAM_UNITS = {
@@ -37,117 +48,97 @@ PARAM_UNITS = {
     "w": "Pa/s"
 }
 
-# Open the GRIB2 file and extract arrays for all available levels
-lats = lons = None
-levels_params = {}
-with pygrib.open(GRIB_PATH) as grbs:
-    latlons_saved = False
-    for grb in grbs:
-        if grb.shortName in PARAMS:
-            level = grb.level
-            if level not in levels_params:
-                levels_params[level] = {}
-            levels_params[level][grb.shortName] = grb.values
-            if not latlons_saved:
-                lats, lons = grb.latlons()
-                latlons_saved = True
+def main():
+    # Open the GRIB2 file and extract arrays for all available levels,
+    # cropping each field to the Fort Worth window as soon as it's decoded
+    # Falls back to the latest matching file in the GRIB cache if GRIB_PATH doesn't exist
+    grib_path = resolve_grib_path(GRIB_PATH)
+    levels_params, window, mask, lats, lons = extract_window_levels(grib_path, PARAMS, FORT_WORTH_BBOX, WORKERS)
+
+    # Only keep levels with all parameters
+    valid_levels = [level for level, params in levels_params.items() if all(p in params for p in PARAMS)]
+    print(f"Valid levels with all parameters: {sorted(valid_levels)}")
 
-# Only keep levels with all parameters
-valid_levels = [level for level, params in levels_params.items() if all(p in params for p in PARAMS)]
-print(f"Valid levels with all parameters: {sorted(valid_levels)}")
+    encode_level_images(levels_params, valid_levels, mask, lats, lons)
 
-# Create mask for Fort Worth bounding box
-lon_min, lat_min, lon_max, lat_max = FORT_WORTH_BBOX
-mask = (
-    (lons >= lon_min) & (lons <= lon_max) &
-    (lats >= lat_min) & (lats <= lat_max)
-)
+def encode_level_images(levels_params, valid_levels, mask, lats, lons, output_folder=OUTPUT_FOLDER, bits=ENCODING_BITS,
+                        atlas=ATLAS):
+    """Write fort_worth_level{N}_img.png (RGBA: u, v, w, gh) and its _meta.json for each valid level.
 
-# Get the shape of the mask
-mask_indices = np.where(mask)
-lat_indices = np.unique(mask_indices[0])
-lon_indices = np.unique(mask_indices[1])
-num_lat = len(lat_indices)
-num_lon = len(lon_indices)
+    With bits=16 the image is written as fort_worth_level{N}_img_hi.png / _img_lo.png instead.
+    With atlas=True all levels go into fort_worth_atlas.png and one manifest instead.
+    Levels (or the atlas) whose input data and settings are unchanged since they
+    were last written are skipped (encode_manifest.json).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    # Image pixel of every mask point; one pixel per grid row/column that holds mask points
+    pixels = mask_pixels(mask)
+    num_lat, num_lon = pixels[2]
 
-# Get min/max lat/lon in the mask
-min_lat = np.min(lats[mask])
-max_lat = np.max(lats[mask])
-min_lon = np.min(lons[mask])
-max_lon = np.max(lons[mask])
+    # Get min/max lat/lon in the mask
+    min_lat = np.min(lats[mask])
+    max_lat = np.max(lats[mask])
+    min_lon = np.min(lons[mask])
+    max_lon = np.max(lons[mask])
+    atlas_images = []
+    atlas_metas = []
+    atlas_digests = []
+    artifacts = load_manifest(output_folder)
+    settings = {"bits": bits, "min_lat": float(min_lat), "max_lat": float(max_lat),
+                "min_lon": float(min_lon), "max_lon": float(max_lon)}
 
-for level in valid_levels:
-    level_data = {}
-    missing = False
-    for short_name in PARAMS:
-        arr = levels_params[level][short_name]
-        if hasattr(arr, 'filled'):
-            arr = arr.filled(np.nan)
-        arr_masked = arr[mask]
-        level_data[short_name] = arr_masked
-    if missing:
-        continue
-    # Calculate geometric vertical velocity w [m/s]
-    R_d = 287.05  # J/kg·K
-    g = 9.81      # m/s²
-    omega = level_data["w"]
-    T = level_data["t"]
-    p = level_data["pres"]
-    w_geom = -(omega * R_d * T) / (p * g)
-    u = level_data["u"]
-    v = level_data["v"]
-    gh = level_data["gh"]
-    # Normalize u, v, w_geom, gh
-    u_min, u_max = np.nanmin(u), np.nanmax(u)
-    v_min, v_max = np.nanmin(v), np.nanmax(v)
-    w_min, w_max = np.nanmin(w_geom), np.nanmax(w_geom)
-    gh_min, gh_max = np.nanmin(gh), np.nanmax(gh)
-    u_norm = (u - u_min) / (u_max - u_min) if u_max > u_min else np.zeros_like(u)
-    v_norm = (v - v_min) / (v_max - v_min) if v_max > v_min else np.zeros_like(v)
-    w_norm = (w_geom - w_min) / (w_max - w_min) if w_max > w_min else np.zeros_like(w_geom)
-    gh_norm = (gh - gh_min) / (gh_max - gh_min) if gh_max > gh_min else np.zeros_like(gh)
-    # Prepare RGBA image array
-    img_array = np.full((num_lat, num_lon, 4), 255, dtype=np.uint8)  # Default to missing
-    # Fill RGBA channels
-    missing_pixel_count = 0
-    for idx, (i, j) in enumerate(zip(mask_indices[0], mask_indices[1])):
-        lat_idx = np.where(lat_indices == i)[0][0]
-        lon_idx = np.where(lon_indices == j)[0][0]
-        # Check for missing data
-        if (
-            np.isnan(u[idx]) or
-            np.isnan(v[idx]) or
-            np.isnan(w_geom[idx]) or
-            np.isnan(gh[idx])
-        ):
-            print(f"Missing data at (lat_idx={lat_idx}, lon_idx={lon_idx}): u={u[idx]}, v={v[idx]}, w_geom={w_geom[idx]}, gh={gh[idx]}")
-            # Already set to 255,255,255,255
-            missing_pixel_count += 1
+    for level in valid_levels:
+        level_data = {short_name: levels_params[level][short_name][mask] for short_name in PARAMS}
+        name = f"fort_worth_level{level}"
+        digest = content_digest([level_data[short_name] for short_name in PARAMS] + [mask],
+                                {**settings, "level": int(level)})
+        if not atlas and is_current(artifacts.get(name), output_folder, digest):
+            print(f"Level {level} unchanged, skipped")
+            continue
+        # Calculate geometric vertical velocity w [m/s]
+        w_geom = omega_to_w(level_data["w"], level_data["t"], level_data["pres"])
+        # RGB: u, v, w_geom normalized per level; A: gh normalized into [1, 254].
+        # Points with missing data are 255 in all channels.
+        img_array, ranges, missing_pixel_count = encode_masked_rgba(
+            level_data["u"], level_data["v"], w_geom, level_data["gh"], pixels, bits)
+        (u_min, u_max), (v_min, v_max), (w_min, w_max), (gh_min, gh_max) = (
+            ranges["u"], ranges["v"], ranges["w"], ranges["alpha"])
+        print(f"Missing/encoded pixels for level {level}: {missing_pixel_count} out of {num_lat * num_lon}")
+        meta = {
+            "level": int(level),
+            "u_min": float(u_min), "u_max": float(u_max),
+            "v_min": float(v_min), "v_max": float(v_max),
+            "w_min": float(w_min), "w_max": float(w_max),
+            "gh_min": float(gh_min), "gh_max": float(gh_max),
+            "min_lat": float(min_lat), "max_lat": float(max_lat),
+            "min_lon": float(min_lon), "max_lon": float(max_lon),
+            "num_lat": int(num_lat), "num_lon": int(num_lon),
+            **ENCODINGS[bits]
+        }
+        if atlas:
+            atlas_images.append(img_array)
+            atlas_metas.append(meta)
+            atlas_digests.append(digest)
+            continue
+        # Save image
+        img_paths = save_encoded_png(img_array, os.path.join(output_folder, f"fort_worth_level{level}_img"))
+        print(f"Saved RGBA image for level {level} to {', '.join(img_paths)}")
+        # Save meta file
+        meta_path = os.path.join(output_folder, f"fort_worth_level{level}_meta.json")
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        print(f"Saved meta file for level {level} to {meta_path}")
+        artifacts[name] = manifest_entry(digest, img_paths + [meta_path])
+
+    if atlas and atlas_images:
+        digest = content_digest([], {"atlas": "fort_worth_atlas", "levels": atlas_digests})
+        if is_current(artifacts.get("fort_worth_atlas"), output_folder, digest):
+            print("Atlas unchanged, skipped")
         else:
-            img_array[lat_idx, lon_idx, 0] = int(np.clip(u_norm[idx] * 255, 0, 255))
-            img_array[lat_idx, lon_idx, 1] = int(np.clip(v_norm[idx] * 255, 0, 255))
-            img_array[lat_idx, lon_idx, 2] = int(np.clip(w_norm[idx] * 255, 0, 255))
-            # Encode gh_norm in [1, 254]
-            alpha = int(1 + gh_norm[idx] * 253)
-            img_array[lat_idx, lon_idx, 3] = np.clip(alpha, 1, 254)
-    # Save image
-    img = Image.fromarray(img_array, mode='RGBA')
-    img_path = os.path.join(OUTPUT_FOLDER, f"fort_worth_level{level}_img.png")
-    img.save(img_path)
-    print(f"Saved RGBA image for level {level} to {img_path}")
-    print(f"Missing/encoded pixels for level {level}: {missing_pixel_count} out of {num_lat * num_lon}")
-    # Save meta file
-    meta = {
-        "level": int(level),
-        "u_min": float(u_min), "u_max": float(u_max),
-        "v_min": float(v_min), "v_max": float(v_max),
-        "w_min": float(w_min), "w_max": float(w_max),
-        "gh_min": float(gh_min), "gh_max": float(gh_max),
-        "min_lat": float(min_lat), "max_lat": float(max_lat),
-        "min_lon": float(min_lon), "max_lon": float(max_lon),
-        "num_lat": int(num_lat), "num_lon": int(num_lon)
-    }
-    meta_path = os.path.join(OUTPUT_FOLDER, f"fort_worth_level{level}_meta.json")
-    with open(meta_path, 'w') as f:
-        json.dump(meta, f, indent=2)
-    print(f"Saved meta file for level {level} to {meta_path}") 
\ No newline at end of file
+            paths = write_atlas(atlas_images, atlas_metas, os.path.join(output_folder, "fort_worth_atlas"))
+            artifacts["fort_worth_atlas"] = manifest_entry(digest, paths)
+            print(f"Saved atlas of {len(atlas_images)} levels: {', '.join(paths)}")
+    save_manifest(output_folder, artifacts)
+
+if __name__ == "__main__":
+    main()
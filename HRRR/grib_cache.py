@@ -0,0 +1,240 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Shared store for every downloaded GRIB2 file (and its .idx)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "HRRRdata_cache")
+INDEX_FILE = "cache_index.json"
+
+# Eviction policy: files not used for MAX_AGE_DAYS go first, then the least
+# recently used ones until the cache fits in MAX_BYTES
+MAX_BYTES = 20 * 1024 ** 3
+MAX_AGE_DAYS = 14
+
+# Herbie/NOMADS file names, e.g. hrrr.t15z.wrfnatf02.grib2
+GRIB_NAME_RE = re.compile(r"hrrr\.t(\d{2})z\.wrf([a-z]+)f(\d{2})\.grib2$")
+
+
+def subset_spec(short_names=None, levels=None):
+    """Canonical form of a message subset; None means the full file."""
+    if short_names is None and levels is None:
+        return None
+    return {
+        "params": sorted(short_names) if short_names is not None else None,
+        "levels": sorted(int(level) for level in levels) if levels is not None else None,
+    }
+
+
+def covers(have, want):
+    """True if a file holding subset `have` contains every message of subset `want`.
+
+    want None asks for the full file. A want field of None (e.g. params given
+    but no levels) asks for nothing specific, so any file of those params covers it.
+    """
+    if have is None:
+        return True
+    if want is None:
+        return False
+    for field in ("params", "levels"):
+        if have[field] is not None and want[field] is not None and not set(want[field]) <= set(have[field]):
+            return False
+    return True
+
+
+def cycle_str(cycle):
+    return f"{cycle:%Y%m%d%H}"
+
+
+class GribCache:
+    """Content-addressed GRIB2 file cache with LRU/age eviction under a byte budget.
+
+    A file is addressed by the hash of (model, product, cycle, fxx, message
+    subset). A request is served by its exact entry, or by the full file or a
+    larger subset of the same forecast hour if one is cached.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, max_age_days=MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model, product, cycle, fxx, subset=None):
+        blob = json.dumps([model, product, cycle_str(cycle), int(fxx), subset], sort_keys=True)
+        return hashlib.sha1(blob.encode()).hexdigest()[:20]
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the index lock: a thread lock plus an OS file lock, so that other
+        processes (the ingest daemon, a script run meanwhile) wait too."""
+        with self._lock, open(os.path.join(self.cache_dir, INDEX_FILE + ".lock"), "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, "objects", key[:2], f"{key}.grib2")
+
+    def _load_index(self):
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path) as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, index_path)
+
+    def lookup(self, model, product, cycle, fxx, short_names=None, levels=None):
+        """Path of a cached file holding the requested messages, or None.
+
+        The exact subset is preferred; otherwise the smallest cached file of the
+        same forecast hour that covers it is used. Marks the entry as used.
+        """
+        want = subset_spec(short_names, levels)
+        with self._locked():
+            index = self._load_index()
+            exact = self.key(model, product, cycle, fxx, want)
+            candidates = [exact] if exact in index else []
+            candidates += sorted(
+                (key for key, entry in index.items()
+                 if key != exact and entry["model"] == model and entry["product"] == product
+                 and entry["cycle"] == cycle_str(cycle) and entry["fxx"] == int(fxx)
+                 and covers(entry["subset"], want)),
+                key=lambda key: index[key]["size"])
+            for key in candidates:
+                path = self.path_for(key)
+                if os.path.exists(path):
+                    index[key]["last_access"] = time.time()
+                    self._save_index(index)
+                    return path
+                del index[key]  # removed behind our back
+            self._save_index(index)
+        return None
+
+    def latest(self, model, product, hour, fxx):
+        """(path, cycle "YYYYMMDDHH") of the most recent cached cycle at this hour of day for fxx, or None.
+
+        Of that cycle's entries the largest (the full file if cached) is used.
+        """
+        with self._locked():
+            index = self._load_index()
+            keys = [key for key, entry in index.items()
+                    if entry["model"] == model and entry["product"] == product
+                    and entry["cycle"].endswith(f"{int(hour):02d}") and entry["fxx"] == int(fxx)
+                    and os.path.exists(self.path_for(key))]
+            if not keys:
+                return None
+            key = max(keys, key=lambda k: (index[k]["cycle"], index[k]["size"]))
+            index[key]["last_access"] = time.time()
+            self._save_index(index)
+        return self.path_for(key), index[key]["cycle"]
+
+    def reserve(self, model, product, cycle, fxx, short_names=None, levels=None):
+        """Destination path to download a new entry to; call add() once it's written."""
+        path = self.path_for(self.key(model, product, cycle, fxx, subset_spec(short_names, levels)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def add(self, model, product, cycle, fxx, short_names=None, levels=None):
+        """Record a file written to its reserve() path, then evict down to the budget."""
+        subset = subset_spec(short_names, levels)
+        key = self.key(model, product, cycle, fxx, subset)
+        path = self.path_for(key)
+        size = os.path.getsize(path)
+        if os.path.exists(path + ".idx"):
+            size += os.path.getsize(path + ".idx")
+        now = time.time()
+        with self._locked():
+            index = self._load_index()
+            index[key] = {
+                "model": model, "product": product, "cycle": cycle_str(cycle), "fxx": int(fxx),
+                "subset": subset, "size": size, "created": now, "last_access": now,
+            }
+            self._evict(index, keep={key})
+            self._save_index(index)
+        return path
+
+    def fetch(self, model, product, cycle, fxx, download, short_names=None, levels=None):
+        """Path of the requested file, calling download(dest_path) only on a cache miss."""
+        path = self.lookup(model, product, cycle, fxx, short_names, levels)
+        if path is not None:
+            print(f"Cache hit: {model} {product} {cycle_str(cycle)} f{int(fxx):02d} -> {path}")
+            return path
+        download(self.reserve(model, product, cycle, fxx, short_names, levels))
+        return self.add(model, product, cycle, fxx, short_names, levels)
+
+    def evict(self):
+        with self._locked():
+            index = self._load_index()
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index, keep=()):
+        """Drop entries older than max_age_days, then least recently used ones over max_bytes."""
+        def remove(key):
+            path = self.path_for(key)
+            for p in (path, path + ".idx"):
+                if os.path.exists(p):
+                    os.remove(p)
+            del index[key]
+
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            for key in [k for k, e in index.items() if e["last_access"] < cutoff and k not in keep]:
+                remove(key)
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            total -= index[key]["size"]
+            remove(key)
+
+
+def resolve_grib_path(grib_path, model="hrrr", cache=None):
+    """Return grib_path if it exists, else the latest cached file with the same name (with a warning).
+
+    Lets scripts keep a Herbie-style file name (hrrr.tHHz.wrfnatfXX.grib2, no
+    date) while the files themselves live in the cache.
+    """
+    if os.path.exists(grib_path):
+        return grib_path
+    match = GRIB_NAME_RE.search(os.path.basename(grib_path))
+    if match:
+        hour, product, fxx = match.groups()
+        cached = (cache or GribCache()).latest(model, product, int(hour), int(fxx))
+        if cached is not None:
+            path, cycle = cached
+            # The name has no date, so this may be a different day than intended
+            print(f"Warning: {grib_path} not found, using the latest cached {product} f{int(fxx):02d} "
+                  f"of cycle {cycle} instead: {path}")
+            return path
+    raise FileNotFoundError(f"GRIB2 file not found: {grib_path} (and not in the GRIB cache)")
@@ -0,0 +1,149 @@
+import glob
+import os
+import re
+import sqlite3
+from grib_cache import CACHE_DIR
+from grib_index import parse_idx
+
+# One SQLite catalog of every message listed in the .idx files we have
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CATALOG_PATH = os.path.join(CACHE_DIR, "grib_catalog.sqlite")
+# Folders scanned for GRIB2 files with an .idx sidecar
+CATALOG_ROOTS = [
+    os.path.join(REPO_DIR, "HRRRdata"),
+    os.path.join(REPO_DIR, "HRRRdata_nat"),
+    os.path.join(REPO_DIR, "HRRRdata_nat_single"),
+    CACHE_DIR,
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    grib_path TEXT UNIQUE NOT NULL,
+    idx_mtime REAL NOT NULL,
+    idx_size INTEGER NOT NULL,
+    cycle TEXT,
+    fxx INTEGER,
+    n_messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    n INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER,
+    var TEXT NOT NULL,
+    level TEXT NOT NULL,
+    level_num INTEGER,
+    level_type TEXT NOT NULL,
+    fcst TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_var_level ON messages (var, level_type, level_num);
+CREATE INDEX IF NOT EXISTS messages_file ON messages (file_id);
+CREATE INDEX IF NOT EXISTS files_cycle ON files (cycle, fxx);
+"""
+
+LEVEL_RE = re.compile(r"^(\d+) (.+)$")
+FCST_RE = re.compile(r"(?:^|-)(\d+) hour")
+
+
+def split_level(level_str):
+    """'12 hybrid level' -> (12, 'hybrid level'); levels without a leading number keep level_num None."""
+    match = LEVEL_RE.match(level_str)
+    if match:
+        return int(match.group(1)), match.group(2)
+    return None, level_str
+
+
+def forecast_hour(entries):
+    """Forecast hour of a file from the FCST fields of its messages ('anl' is 0)."""
+    for entry in entries:
+        if entry["fcst"] == "anl":
+            return 0
+        match = FCST_RE.search(entry["fcst"])
+        if match and "acc" not in entry["fcst"] and "ave" not in entry["fcst"]:
+            return int(match.group(1))
+    return None
+
+
+def connect(db_path=CATALOG_PATH):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def find_grib_files(roots=CATALOG_ROOTS):
+    """GRIB2 files below roots that have an .idx sidecar (partial downloads excluded)."""
+    paths = set()
+    for root in roots:
+        for idx_path in glob.glob(os.path.join(root, "**", "*.idx"), recursive=True):
+            grib_path = idx_path[:-len(".idx")]
+            if not grib_path.endswith(".part") and os.path.exists(grib_path):
+                paths.add(os.path.abspath(grib_path))
+    return sorted(paths)
+
+
+def update_catalog(conn, grib_paths):
+    """Add or refresh the given files; files whose .idx is unchanged are skipped. Returns the number (re)indexed."""
+    known = {path: (mtime, size) for path, mtime, size in conn.execute("SELECT grib_path, idx_mtime, idx_size FROM files")}
+    updated = 0
+    with conn:
+        for grib_path in grib_paths:
+            idx_stat = os.stat(grib_path + ".idx")
+            if known.get(grib_path) == (idx_stat.st_mtime, idx_stat.st_size):
+                continue
+            entries = parse_idx(grib_path + ".idx")
+            conn.execute("DELETE FROM files WHERE grib_path = ?", (grib_path,))
+            cur = conn.execute(
+                "INSERT INTO files (grib_path, idx_mtime, idx_size, cycle, fxx, n_messages) VALUES (?, ?, ?, ?, ?, ?)",
+                (grib_path, idx_stat.st_mtime, idx_stat.st_size, entries[0]["date"] if entries else None,
+                 forecast_hour(entries), len(entries)))
+            conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(cur.lastrowid, e["n"], e["offset"], e["length"], e["var"], e["level"],
+                  *split_level(e["level"]), e["fcst"]) for e in entries])
+            updated += 1
+    return updated
+
+
+def build_catalog(roots=CATALOG_ROOTS, db_path=CATALOG_PATH):
+    """Bring the catalog in line with the .idx files below roots and return the open connection."""
+    conn = connect(db_path)
+    grib_paths = find_grib_files(roots)
+    updated = update_catalog(conn, grib_paths)
+    present = set(grib_paths)
+    with conn:
+        gone = [(path,) for (path,) in conn.execute("SELECT grib_path FROM files") if path not in present]
+        conn.executemany("DELETE FROM files WHERE grib_path = ?", gone)
+    print(f"GRIB catalog: {len(grib_paths)} files ({updated} reindexed, {len(gone)} removed) in {db_path}")
+    return conn
+
+
+def query(conn, var=None, level_num=None, level_type="hybrid level", cycle=None, fxx=None, grib_path=None):
+    """Messages matching every given filter, as dicts in (file, message number) order.
+
+    var is the .idx name (e.g. 'UGRD'); cycle is 'YYYYMMDDHH' or a datetime.
+    Pass level_type=None to match any level type.
+    """
+    clauses = []
+    args = []
+    for column, value in (("m.var", var), ("m.level_num", level_num), ("m.level_type", level_type),
+                          ("f.fxx", fxx), ("f.grib_path", grib_path)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            args.append(value)
+    if cycle is not None:
+        clauses.append("f.cycle = ?")
+        args.append(cycle if isinstance(cycle, str) else f"{cycle:%Y%m%d%H}")
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    rows = conn.execute(
+        "SELECT f.grib_path, f.cycle, f.fxx, m.n, m.offset, m.length, m.var, m.level, m.level_num, m.level_type, m.fcst"
+        f" FROM messages m JOIN files f ON f.id = m.file_id{where} ORDER BY f.grib_path, m.n", args)
+    keys = ["grib_path", "cycle", "fxx", "n", "offset", "length", "var", "level", "level_num", "level_type", "fcst"]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def files_with(conn, var, level_num=None, level_type="hybrid level", cycle=None, fxx=None):
+    """Distinct GRIB2 paths holding var (on level_num, for cycle/fxx if given)."""
+    return sorted({row["grib_path"] for row in query(conn, var, level_num, level_type, cycle, fxx)})
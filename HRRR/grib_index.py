@@ -0,0 +1,144 @@
+import os
+import pygrib
+
+# Map .idx variable names to the pygrib shortNames used by the extract scripts
+IDX_TO_SHORT_NAME = {
+    "PRES": "pres",
+    "HGT": "gh",
+    "TMP": "t",
+    "UGRD": "u",
+    "VGRD": "v",
+    "VVEL": "w",
+}
+SHORT_NAME_TO_IDX = {short: var for var, short in IDX_TO_SHORT_NAME.items()}
+
+HYBRID_LEVEL = "hybrid level"
+
+
+def parse_idx(idx_path):
+    """Parse a wgrib2-style .idx inventory file into a list of message entries."""
+    with open(idx_path) as f:
+        return parse_idx_lines(f)
+
+
+def parse_idx_lines(lines):
+    """Parse .idx inventory lines into a list of message entries.
+
+    Each line looks like `n:offset:d=YYYYMMDDHH:VAR:LEVEL:FCST:`. The length
+    of a message is the distance to the next offset; the last message gets
+    None (read to end of file).
+    """
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split(":")
+        entries.append({
+            "n": int(parts[0]),
+            "offset": int(parts[1]),
+            "date": parts[2][2:] if parts[2].startswith("d=") else parts[2],
+            "var": parts[3],
+            "level": parts[4],
+            "fcst": parts[5] if len(parts) > 5 else "",
+        })
+    for entry, next_entry in zip(entries, entries[1:]):
+        entry["length"] = next_entry["offset"] - entry["offset"]
+    if entries:
+        entries[-1]["length"] = None
+    return entries
+
+
+def format_idx_line(entry):
+    """Format an entry back into a .idx inventory line."""
+    return f"{entry['n']}:{entry['offset']}:d={entry['date']}:{entry['var']}:{entry['level']}:{entry['fcst']}:"
+
+
+def coalesce_ranges(selected):
+    """Merge the byte ranges of selected messages that are adjacent in the file.
+
+    Returns a list of (start, end) with an inclusive end, or end None for a
+    range running to the end of the file, in file order.
+    """
+    ranges = []
+    for entry in sorted(selected, key=lambda e: e["offset"]):
+        start = entry["offset"]
+        end = None if entry["length"] is None else start + entry["length"] - 1
+        if ranges and ranges[-1][1] is not None and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def level_number(level_str, level_type=HYBRID_LEVEL):
+    """Return the integer level from e.g. '12 hybrid level', or None for other level types."""
+    if not level_str.endswith(" " + level_type):
+        return None
+    try:
+        return int(level_str[:-len(level_type) - 1])
+    except ValueError:
+        return None
+
+
+def select_messages(entries, short_names, levels=None, level_type=HYBRID_LEVEL):
+    """Return the entries for the given shortNames on the given levels (all levels if None)."""
+    wanted_vars = {SHORT_NAME_TO_IDX[s] for s in short_names}
+    selected = []
+    for entry in entries:
+        if entry["var"] not in wanted_vars:
+            continue
+        level = level_number(entry["level"], level_type)
+        if level is None or (levels is not None and level not in levels):
+            continue
+        selected.append(dict(entry, short_name=IDX_TO_SHORT_NAME[entry["var"]], level_num=level))
+    return selected
+
+
+def read_message_bytes(f, entry):
+    """Read the raw bytes of one message from an open binary file."""
+    f.seek(entry["offset"])
+    if entry["length"] is None:
+        return f.read()
+    return f.read(entry["length"])
+
+
+def decode_message(raw):
+    """Decode a single GRIB2 message from its raw bytes."""
+    return pygrib.fromstring(raw)
+
+
+def iter_selected_messages(grib_path, selected):
+    """Seek straight to each selected message and yield (entry, decoded grib message)."""
+    # Read in file order so the OS read-ahead works for us
+    with open(grib_path, "rb") as f:
+        for entry in sorted(selected, key=lambda e: e["offset"]):
+            yield entry, decode_message(read_message_bytes(f, entry))
+
+
+def find_idx(grib_path):
+    """Return the path of the .idx sidecar for a GRIB file, or None if it's missing."""
+    idx_path = grib_path + ".idx"
+    return idx_path if os.path.exists(idx_path) else None
+
+
+def iter_param_messages(grib_path, short_names, levels=None):
+    """Yield the hybrid-level GRIB messages for short_names (on levels, if given).
+
+    Seeks via the .idx sidecar when it exists; otherwise every message in the
+    file is scanned.
+    """
+    idx_path = find_idx(grib_path)
+    if idx_path:
+        selected = select_messages(parse_idx(idx_path), short_names, levels)
+        print(f"Decoding {len(selected)} messages selected from {idx_path}")
+        for _, grb in iter_selected_messages(grib_path, selected):
+            yield grb
+    else:
+        print(f"Warning: {grib_path}.idx not found, scanning all messages")
+        with pygrib.open(grib_path) as grbs:
+            for grb in grbs:
+                if grb.shortName not in short_names or grb.typeOfLevel != "hybrid":
+                    continue
+                if levels is None or grb.level in levels:
+                    yield grb
@@ -0,0 +1,141 @@
+import concurrent.futures
+import os
+import requests
+from grib_index import coalesce_ranges, decode_message
+from hrrr_grid import crop, grid_from_message
+from subset_download import CHUNK_SIZE, compact_idx_lines, fetch_selected, iter_range
+
+
+def iter_http_chunks(session, url, ranges):
+    """Yield (offset, bytes) chunks of the byte ranges of a remote file as they arrive."""
+    for start, end in ranges:
+        offset = start
+        for chunk in iter_range(session, url, start, end):
+            yield offset, chunk
+            offset += len(chunk)
+
+
+def iter_file_chunks(path, ranges, chunk_size=CHUNK_SIZE):
+    """Yield (offset, bytes) chunks of the byte ranges of a local file (the same stream, without a network)."""
+    with open(path, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            offset = start
+            while end is None or offset <= end:
+                chunk = f.read(chunk_size if end is None else min(chunk_size, end - offset + 1))
+                if not chunk:
+                    break
+                yield offset, chunk
+                offset += len(chunk)
+
+
+def iter_stream_messages(chunks, selected):
+    """Yield (entry, raw bytes) for each selected message as soon as its last byte has arrived.
+
+    chunks yields (file offset, bytes) in file order covering the byte ranges
+    of the selected entries (e.g. coalesce_ranges(selected)). A message with
+    no length (the last one of the file) is complete at the end of the stream.
+    """
+    pending = sorted(selected, key=lambda e: e["offset"])
+    buf = bytearray()
+    buf_start = 0
+    i = 0
+    for offset, chunk in chunks:
+        if offset != buf_start + len(buf):
+            # Next byte range: whatever is left of the previous one isn't selected
+            buf = bytearray()
+            buf_start = offset
+        buf += chunk
+        while i < len(pending) and pending[i]["length"] is not None:
+            entry = pending[i]
+            end = entry["offset"] + entry["length"]
+            if entry["offset"] < buf_start or end > buf_start + len(buf):
+                break
+            yield entry, bytes(buf[entry["offset"] - buf_start:end - buf_start])
+            del buf[:end - buf_start]
+            buf_start = end
+            i += 1
+    if i < len(pending) and pending[i]["length"] is None and pending[i]["offset"] >= buf_start:
+        yield pending[i], bytes(buf[pending[i]["offset"] - buf_start:])
+        i += 1
+    if i < len(pending):
+        raise IOError(f"Stream ended before message {pending[i]['n']} ({pending[i]['var']} {pending[i]['level']}) was complete")
+
+
+def _decode_crop(raw, window):
+    """Worker: decode one message from its bytes and crop it to the window."""
+    return crop(decode_message(raw).values, window)
+
+
+def stream_extract(chunks, selected, bbox, workers=1, on_level=None, out_path=None):
+    """Decode and crop the selected messages while their bytes are still streaming in.
+
+    Each complete message is handed to a process pool right away, so decoding
+    overlaps the transfer. When all parameters of a level are decoded,
+    on_level(level, params, mask, lats, lons) is called (e.g. to encode that
+    level's image) while the rest is still arriving. With out_path, the
+    streamed messages are also written there as a compact GRIB2 file with a
+    matching .idx. Returns (levels_params, window, mask, lats, lons) like
+    extract_window_levels().
+    """
+    short_names = {entry["short_name"] for entry in selected}
+    remaining = {}
+    for entry in selected:
+        remaining.setdefault(entry["level_num"], set()).add(entry["short_name"])
+    levels_params = {}
+    window = mask = lats = lons = None
+
+    def store(entry, arr):
+        params = levels_params.setdefault(entry["level_num"], {})
+        params[entry["short_name"]] = arr
+        remaining[entry["level_num"]].discard(entry["short_name"])
+        if on_level is not None and not remaining[entry["level_num"]] and set(params) >= short_names:
+            on_level(entry["level_num"], params, mask, lats, lons)
+
+    out_file = open(out_path + ".part", "wb") if out_path else None
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    futures = {}
+    try:
+        for entry, raw in iter_stream_messages(chunks, selected):
+            if out_file is not None:
+                out_file.write(raw)
+            if window is None:
+                # The grid and window come from the first message, decoded here
+                grb = decode_message(raw)
+                grid = grid_from_message(grb)
+                window, mask = grid.bbox_window(bbox)
+                lats, lons = grid.latlons(window)
+                store(entry, crop(grb.values, window))
+            elif executor is None:
+                store(entry, _decode_crop(raw, window))
+            else:
+                futures[executor.submit(_decode_crop, raw, window)] = entry
+                # Hand back whatever has finished decoding meanwhile
+                for future in [f for f in futures if f.done()]:
+                    store(futures.pop(future), future.result())
+        for future in concurrent.futures.as_completed(list(futures)):
+            store(futures.pop(future), future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if out_file is not None:
+            out_file.close()
+
+    if window is None:
+        raise RuntimeError("No messages selected to stream")
+    if out_path:
+        with open(out_path + ".part.idx", "w") as f:
+            f.write("\n".join(compact_idx_lines(selected)) + "\n")
+        os.replace(out_path + ".part", out_path)
+        os.replace(out_path + ".part.idx", out_path + ".idx")
+    return levels_params, window, mask, lats, lons
+
+
+def stream_extract_url(grib_url, idx_url, short_names, bbox, levels=None, workers=1, on_level=None,
+                       out_path=None, session=None):
+    """stream_extract() over HTTP Range requests for the selected messages of a remote GRIB2 file."""
+    session = session or requests.Session()
+    selected = fetch_selected(session, idx_url, short_names, levels)
+    ranges = coalesce_ranges(selected)
+    print(f"Streaming {len(selected)} messages in {len(ranges)} range requests from {grib_url}")
+    return stream_extract(iter_http_chunks(session, grib_url, ranges), selected, bbox, workers, on_level, out_path)
@@ -0,0 +1,34 @@
+from grib_index import find_idx, iter_param_messages, parse_idx, select_messages
+from hrrr_grid import crop, grid_from_grib, grid_from_message
+from parallel_decode import decode_parallel
+
+
+def extract_window_levels(grib_path, short_names, bbox, workers=1):
+    """Decode the hybrid-level fields for short_names, cropped to the bbox window.
+
+    Returns (levels_params, window, mask, lats, lons) where levels_params maps
+    level -> {short_name: window array}. With workers > 1 and an .idx next to
+    the GRIB file, the selected messages are decoded in a process pool.
+    """
+    levels_params = {}
+    idx_path = find_idx(grib_path)
+    if workers > 1 and idx_path:
+        grid = grid_from_grib(grib_path)
+        window, mask = grid.bbox_window(bbox)
+        selected = select_messages(parse_idx(idx_path), short_names)
+        print(f"Decoding {len(selected)} messages selected from {idx_path} with {workers} workers")
+        windows = decode_parallel([(grib_path, entry) for entry in selected], window, workers)
+        for entry, arr in zip(selected, windows):
+            levels_params.setdefault(entry["level_num"], {})[entry["short_name"]] = arr
+    else:
+        grid = window = mask = None
+        for grb in iter_param_messages(grib_path, short_names):
+            # Compute the index window once from the projection of the first message
+            if window is None:
+                grid = grid_from_message(grb)
+                window, mask = grid.bbox_window(bbox)
+            levels_params.setdefault(grb.level, {})[grb.shortName] = crop(grb.values, window)
+    if window is None:
+        raise RuntimeError(f"No messages for {list(short_names)} found in {grib_path}")
+    lats, lons = grid.latlons(window)
+    return levels_params, window, mask, lats, lons
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import math
+import os
+import numpy as np
+
+# Grid definitions (and the bbox windows computed on them) are cached here
+GRID_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "HRRRdata_nat", "grid_cache")
+
+# GRIB2 keys that fully define a Lambert conformal grid
+LAMBERT_KEYS = [
+    "Nx", "Ny",
+    "latitudeOfFirstGridPointInDegrees", "longitudeOfFirstGridPointInDegrees",
+    "LaDInDegrees", "LoVInDegrees", "Latin1InDegrees", "Latin2InDegrees",
+    "DxInMetres", "DyInMetres",
+    "iScansNegatively", "jScansPositively",
+]
+
+
+def bbox_window(lats, lons, bbox):
+    """Find the smallest (row, col) index window of the grid that covers a bounding box.
+
+    bbox is (lon_min, lat_min, lon_max, lat_max). Returns (window, mask) where
+    window is a (row slice, col slice) tuple and mask is the bbox mask inside
+    that window. The HRRR grid is Lambert conformal, so the bbox is not a
+    rectangle in index space and the mask is still needed within the window.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    mask = (
+        (lons >= lon_min) & (lons <= lon_max) &
+        (lats >= lat_min) & (lats <= lat_max)
+    )
+    rows = np.where(mask.any(axis=1))[0]
+    cols = np.where(mask.any(axis=0))[0]
+    if rows.size == 0:
+        raise ValueError(f"No grid points inside bounding box {bbox}")
+    window = (slice(int(rows[0]), int(rows[-1]) + 1), slice(int(cols[0]), int(cols[-1]) + 1))
+    return window, mask[window]
+
+
+def crop(values, window):
+    """Crop a decoded field to the window as float32, with masked values as NaN.
+
+    The result owns its memory, so the full CONUS array can be freed right away.
+    """
+    arr = values[window]
+    if hasattr(arr, 'filled'):
+        arr = arr.filled(np.nan)
+    return arr.astype(np.float32)
+
+
+class LambertGrid:
+    """Lambert conformal grid (e.g. HRRR CONUS) with analytic lat/lon <-> index lookup.
+
+    Rows (j) run south to north and columns (i) west to east, matching the
+    (Ny, Nx) arrays returned by pygrib for HRRR.
+    """
+
+    def __init__(self, params, cache_dir=GRID_CACHE_DIR):
+        self.params = dict(params)
+        self.cache_dir = cache_dir
+        self._windows = dict(self.params.pop("windows", {}))
+        p = self.params
+        if p["iScansNegatively"] or not p["jScansPositively"]:
+            raise ValueError("Only grids scanning west-east and south-north are supported")
+        self.nx, self.ny = int(p["Nx"]), int(p["Ny"])
+        self.dx, self.dy = float(p["DxInMetres"]), float(p["DyInMetres"])
+        phi1 = math.radians(p["Latin1InDegrees"])
+        phi2 = math.radians(p["Latin2InDegrees"])
+        if math.isclose(phi1, phi2):
+            n = math.sin(phi1)
+        else:
+            n = (math.log(math.cos(phi1) / math.cos(phi2)) /
+                 math.log(math.tan(math.pi / 4 + phi2 / 2) / math.tan(math.pi / 4 + phi1 / 2)))
+        self._n = n
+        self._lon0 = math.radians(p["LoVInDegrees"])
+        self._rf = p["radius"] * math.cos(phi1) * math.tan(math.pi / 4 + phi1 / 2) ** n / n
+        self._rho0 = self._rf / math.tan(math.pi / 4 + math.radians(p["LaDInDegrees"]) / 2) ** n
+        self._x0, self._y0 = self._project(p["latitudeOfFirstGridPointInDegrees"],
+                                           p["longitudeOfFirstGridPointInDegrees"])
+
+    @property
+    def key(self):
+        """Short hash identifying the grid definition."""
+        blob = json.dumps(self.params, sort_keys=True).encode()
+        return hashlib.sha1(blob).hexdigest()[:16]
+
+    @property
+    def shape(self):
+        return (self.ny, self.nx)
+
+    def _project(self, lat, lon):
+        lat = np.radians(lat)
+        # Wrap the longitude difference into [-pi, pi)
+        dlon = (np.radians(lon) - self._lon0 + np.pi) % (2 * np.pi) - np.pi
+        rho = self._rf / np.tan(np.pi / 4 + lat / 2) ** self._n
+        theta = self._n * dlon
+        return rho * np.sin(theta), self._rho0 - rho * np.cos(theta)
+
+    def latlon_to_ij(self, lat, lon):
+        """Fractional (i, j) = (column, row) grid coordinates of lat/lon points."""
+        x, y = self._project(lat, lon)
+        return (x - self._x0) / self.dx, (y - self._y0) / self.dy
+
+    def ij_to_latlon(self, i, j):
+        """Latitude/longitude (degrees, lon in [-180, 180)) of fractional grid coordinates."""
+        x = self._x0 + np.asarray(i, dtype=np.float64) * self.dx
+        y = self._rho0 - (self._y0 + np.asarray(j, dtype=np.float64) * self.dy)
+        sign = math.copysign(1.0, self._n)
+        rho = sign * np.hypot(x, y)
+        theta = np.arctan2(sign * x, sign * y)
+        lat = 2 * np.arctan((self._rf / rho) ** (1 / self._n)) - np.pi / 2
+        lon = self._lon0 + theta / self._n
+        lon = (np.degrees(lon) + 180) % 360 - 180
+        return np.degrees(lat), lon
+
+    def latlons(self, window=None):
+        """2D latitude/longitude arrays for a (row slice, col slice) window, or the whole grid."""
+        rows, cols = window if window is not None else (slice(0, self.ny), slice(0, self.nx))
+        jj, ii = np.meshgrid(np.arange(rows.start, rows.stop), np.arange(cols.start, cols.stop), indexing="ij")
+        return self.ij_to_latlon(ii, jj)
+
+    def bbox_window(self, bbox, samples=64):
+        """Return (window, mask) for a bbox without building the full lat/lon arrays.
+
+        The bbox edges are projected to index space to get a candidate window,
+        which is then tightened with the exact lat/lon test on just that window.
+        Windows are cached on disk along with the grid definition.
+        """
+        bbox_key = ",".join(f"{v:.6f}" for v in bbox)
+        if bbox_key in self._windows:
+            return self._tighten(bbox, *self._windows[bbox_key])
+
+        lon_min, lat_min, lon_max, lat_max = bbox
+        t = np.linspace(0.0, 1.0, samples)
+        edge_lats = np.concatenate([np.full(samples, lat_min), np.full(samples, lat_max),
+                                    lat_min + t * (lat_max - lat_min), lat_min + t * (lat_max - lat_min)])
+        edge_lons = np.concatenate([lon_min + t * (lon_max - lon_min), lon_min + t * (lon_max - lon_min),
+                                    np.full(samples, lon_min), np.full(samples, lon_max)])
+        i, j = self.latlon_to_ij(edge_lats, edge_lons)
+        # One cell of margin on each side covers the curvature between samples
+        r0 = max(int(np.floor(j.min())) - 1, 0)
+        r1 = min(int(np.ceil(j.max())) + 2, self.ny)
+        c0 = max(int(np.floor(i.min())) - 1, 0)
+        c1 = min(int(np.ceil(i.max())) + 2, self.nx)
+        if r0 >= r1 or c0 >= c1:
+            raise ValueError(f"No grid points inside bounding box {bbox}")
+        window, mask = self._tighten(bbox, r0, r1, c0, c1)
+
+        self._windows[bbox_key] = [window[0].start, window[0].stop, window[1].start, window[1].stop]
+        self.save()
+        return window, mask
+
+    def _tighten(self, bbox, r0, r1, c0, c1):
+        """bbox_window() within the candidate rows r0:r1 and columns c0:c1, as a window of the full grid."""
+        lats, lons = self.latlons((slice(r0, r1), slice(c0, c1)))
+        (rows, cols), mask = bbox_window(lats, lons, bbox)
+        return (slice(r0 + rows.start, r0 + rows.stop), slice(c0 + cols.start, c0 + cols.stop)), mask
+
+    def save(self):
+        """Write the grid definition and cached windows to the cache directory."""
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{self.key}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(self.params, windows=self._windows), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, key, cache_dir=GRID_CACHE_DIR):
+        """Load a cached grid by its key, or return None if it isn't cached."""
+        path = os.path.join(cache_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls(json.load(f), cache_dir=cache_dir)
+
+
+def grid_from_message(grb, cache_dir=GRID_CACHE_DIR):
+    """Build the grid of a GRIB message from its projection keys (no values are decoded).
+
+    The grid definition is cached on disk keyed by a hash of those keys.
+    """
+    if grb.gridType != "lambert":
+        raise ValueError(f"Unsupported grid type: {grb.gridType}")
+    params = {k: grb[k] for k in LAMBERT_KEYS}
+    params["radius"] = float(grb.projparams["a"])
+    grid = LambertGrid(params, cache_dir=cache_dir)
+    cached = LambertGrid.load(grid.key, cache_dir) if cache_dir is not None else None
+    if cached is not None:
+        return cached
+    grid.save()
+    return grid
+
+
+def grid_from_grib(grib_path, cache_dir=GRID_CACHE_DIR):
+    """Build the grid from the first message of a GRIB file."""
+    import pygrib
+    with pygrib.open(grib_path) as grbs:
+        return grid_from_message(grbs.message(1), cache_dir=cache_dir)
@@ -1,54 +1,60 @@
 import os
-import shutil
-import requests
 from herbie import Herbie
 from datetime import datetime, timedelta, UTC
 import concurrent.futures
 from tqdm import tqdm
+from downloader import Downloader
+from grib_cache import GribCache
+from subset_download import download_subset
+
+# Subset mode: fetch only these parameters on these hybrid levels via HTTP
+# Range requests instead of the full wrfnat file (hundreds of MB). Off by
+# default: the extract scripts then get all 50 hybrid levels, as before
+SUBSET = False
+SUBSET_PARAMS = ["pres", "gh", "t", "u", "v", "w"]
+SUBSET_LEVELS = range(1, 23)  # hybrid levels 1-22
+
+# Concurrent downloads; all of them share one pooled HTTP session
+MAX_WORKERS = 4
+DOWNLOADER = Downloader(max_workers=MAX_WORKERS)
+
+# Files are stored in (and reused from) the shared GRIB cache, see grib_cache.py
+CACHE = GribCache()
 
 def download_forecast_hour(args):
-    forecast_datetime_aware, hour, data_folder = args
+    forecast_datetime_aware, hour = args
     forecast_hour = f"f{hour:02d}"
 
     try:
         # Convert to tz-naive (Herbie expects naive datetime in UTC)
         forecast_datetime_naive = forecast_datetime_aware.replace(tzinfo=None)
 
-        # Create Herbie instance
-        H = Herbie(
-            forecast_datetime_naive,
-            model="hrrr",
-            product="nat",  # This is for wrfnat files
-            fxx=hour,
-            save_dir=os.path.join(data_folder, "temp"),
-            verbose=False,
-        )
-
-        # Download GRIB2 file
-        grib_path = H.download()
-        if grib_path is None or not os.path.exists(grib_path):
-            raise Exception("GRIB file not downloaded or not found.")
-
-        # Download .idx file using Herbie.idx URL
-        idx_url = H.idx
-        idx_path = str(grib_path) + ".idx"
-
-        response = requests.get(idx_url)
-        if response.status_code == 200:
-            with open(idx_path, "wb") as f:
-                f.write(response.content)
-        else:
-            print(f"\nWarning: Failed to fetch .idx file for {forecast_hour} (HTTP {response.status_code})")
-            idx_path = None
-
-        # Move GRIB and IDX files to target directory
-        final_grib_path = os.path.join(data_folder, os.path.basename(grib_path))
-        shutil.move(grib_path, final_grib_path)
-
-        if idx_path and os.path.exists(idx_path):
-            final_idx_path = os.path.join(data_folder, os.path.basename(idx_path))
-            shutil.move(idx_path, final_idx_path)
-
+        # Only called on a cache miss
+        def download(dest):
+            # Herbie is only used to find the GRIB2/.idx URLs on the first available source
+            H = Herbie(
+                forecast_datetime_naive,
+                model="hrrr",
+                product="nat",  # This is for wrfnat files
+                fxx=hour,
+                verbose=False,
+            )
+            if SUBSET:
+                # Compact GRIB2 with only the wanted messages, plus its rewritten .idx
+                download_subset(H.grib, H.idx, dest, SUBSET_PARAMS, SUBSET_LEVELS, session=DOWNLOADER.session)
+                return
+            # Download the .idx first so the GRIB2 file can be verified against it
+            idx_path = dest + ".idx"
+            try:
+                DOWNLOADER.fetch(H.idx, idx_path)
+            except Exception as e:
+                print(f"\nWarning: Failed to fetch .idx file for {forecast_hour} ({e})")
+                idx_path = None
+            # Resumable, verified download straight into the cache
+            DOWNLOADER.fetch(H.grib, dest, idx_path=idx_path)
+
+        subset = (SUBSET_PARAMS, SUBSET_LEVELS) if SUBSET else (None, None)
+        CACHE.fetch("hrrr", "nat", forecast_datetime_naive, hour, download, *subset)
         return True
 
     except Exception as e:
@@ -62,18 +68,15 @@ current_time = datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
 forecast_datetime = current_time - timedelta(hours=24)
 print(f"Using forecast date: {forecast_datetime:%Y-%m-%d %H:%M}")
 
-# Output directory
-data_folder = os.path.join(os.getcwd(), "HRRRdata_nat")  # Different folder for nat files
-os.makedirs(data_folder, exist_ok=True)
-print(f"Saving data to: {data_folder}")
+print(f"Saving data to the GRIB cache: {os.path.abspath(CACHE.cache_dir)}")
 
 # Forecast hours to download
 forecast_hours = range(2, 8)  # f02 to f07
-download_args = [(forecast_datetime, hour, data_folder) for hour in forecast_hours]
+download_args = [(forecast_datetime, hour) for hour in forecast_hours]
 
 # --- Download in parallel ---
 print("Starting parallel downloads...")
-with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
     results = list(tqdm(
         executor.map(download_forecast_hour, download_args),
         total=len(download_args),
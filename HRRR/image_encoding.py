@@ -0,0 +1,153 @@
+import numpy as np
+from PIL import Image
+
+# RGBA value of pixels with missing data (alpha 255 never encodes a level)
+MISSING = 255
+MISSING16 = 65535
+
+# Texture encodings, recorded in every meta file as "encoding"/"encoding_version":
+# 8 bits per channel in one PNG, or 16 bits per channel split into a hi-byte
+# and a lo-byte PNG (value = hi * 256 + lo)
+ENCODINGS = {
+    8: {"encoding": "rgba8", "encoding_version": 1},
+    16: {"encoding": "rgba16_hilo", "encoding_version": 2},
+}
+
+
+def normalize(values, value_range=None):
+    """Scale values to [0, 1] by their NaN-ignoring min/max; returns (norm, min, max).
+
+    A constant field normalizes to zeros. With value_range=(min, max) that
+    range is used instead (e.g. one range held fixed over a time series).
+    """
+    vmin, vmax = value_range if value_range is not None else (np.nanmin(values), np.nanmax(values))
+    norm = (values - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(values)
+    return norm, vmin, vmax
+
+
+def quantize(norm):
+    """[0, 1] -> 0..255: norm * 255 clipped and truncated, as uint8."""
+    return np.clip(norm * 255, 0, 255).astype(np.uint8)
+
+
+def quantize_alpha(norm):
+    """[0, 1] -> 1..254 (0 and 255 are left free): 1 + norm * 253 truncated, then clipped."""
+    return np.clip((1 + np.asarray(norm) * 253).astype(np.int64), 1, 254).astype(np.uint8)
+
+
+def quantize16(norm):
+    """[0, 1] -> 0..65535: norm * 65535 clipped and truncated, as uint16."""
+    return np.clip(norm * 65535, 0, 65535).astype(np.uint16)
+
+
+def quantize_alpha16(norm):
+    """[0, 1] -> 1..65534 (0 and 65535 are left free): 1 + norm * 65533 truncated, then clipped."""
+    return np.clip((1 + np.asarray(norm, dtype=np.float64) * 65533).astype(np.int64), 1, 65534).astype(np.uint16)
+
+
+def encode_rgba(u_norm, v_norm, w_norm, alpha_norm, valid):
+    """Encode normalized u/v/w into RGB and alpha_norm into A for every point.
+
+    All arrays share valid's shape (alpha_norm may be a scalar). Points where
+    valid is False get MISSING in all four channels. Returns a uint8 array
+    of shape valid.shape + (4,).
+    """
+    rgba = np.empty(valid.shape + (4,), dtype=np.uint8)
+    # Invalid points may hold NaN; whatever they cast to is overwritten below
+    with np.errstate(invalid="ignore"):
+        rgba[..., 0] = quantize(u_norm)
+        rgba[..., 1] = quantize(v_norm)
+        rgba[..., 2] = quantize(w_norm)
+        rgba[..., 3] = quantize_alpha(alpha_norm)
+    rgba[~valid] = MISSING
+    return rgba
+
+
+def encode_rgba16(u_norm, v_norm, w_norm, alpha_norm, valid):
+    """16-bit version of encode_rgba(): uint16 channels, MISSING16 where valid is False."""
+    rgba = np.empty(valid.shape + (4,), dtype=np.uint16)
+    with np.errstate(invalid="ignore"):
+        rgba[..., 0] = quantize16(u_norm)
+        rgba[..., 1] = quantize16(v_norm)
+        rgba[..., 2] = quantize16(w_norm)
+        rgba[..., 3] = quantize_alpha16(alpha_norm)
+    rgba[~valid] = MISSING16
+    return rgba
+
+
+def split_hi_lo(rgba16):
+    """Split a uint16 RGBA array into its (hi byte, lo byte) uint8 RGBA arrays."""
+    return (rgba16 >> 8).astype(np.uint8), (rgba16 & 0xFF).astype(np.uint8)
+
+
+def join_hi_lo(hi, lo):
+    """Inverse of split_hi_lo(): the uint16 RGBA array from its hi/lo byte arrays."""
+    return (hi.astype(np.uint16) << 8) | lo
+
+
+def save_encoded_png(rgba, path_stem):
+    """Save an encoded RGBA array as PNG(s) and return their paths.
+
+    uint8 arrays go to {path_stem}.png; uint16 arrays are split into
+    {path_stem}_hi.png and {path_stem}_lo.png.
+    """
+    if rgba.dtype == np.uint8:
+        paths = [path_stem + ".png"]
+        images = [rgba]
+    else:
+        paths = [path_stem + "_hi.png", path_stem + "_lo.png"]
+        images = split_hi_lo(rgba)
+    for image, path in zip(images, paths):
+        Image.fromarray(image, mode='RGBA').save(path)
+    return paths
+
+
+def load_encoded_png(path_stem, bits=8):
+    """Inverse of save_encoded_png(): the uint8 (or uint16 for bits=16) RGBA array."""
+    if bits == 16:
+        hi, lo = (np.array(Image.open(f"{path_stem}_{part}.png")) for part in ("hi", "lo"))
+        return join_hi_lo(hi, lo)
+    return np.array(Image.open(path_stem + ".png"))
+
+
+def mask_pixels(mask):
+    """Image coordinates of the True points of a 2D mask, in np.nonzero order.
+
+    The image has one row per grid row and one column per grid column that
+    holds any mask point, so each point's pixel is its row/column minus the
+    number of empty rows/columns before it. Returns
+    (pixel_rows, pixel_cols, (num_rows, num_cols)).
+    """
+    mask_rows, mask_cols = np.nonzero(mask)
+    row_used = mask.any(axis=1)
+    col_used = mask.any(axis=0)
+    pixel_rows = (np.cumsum(row_used) - 1)[mask_rows]
+    pixel_cols = (np.cumsum(col_used) - 1)[mask_cols]
+    return pixel_rows, pixel_cols, (int(np.count_nonzero(row_used)), int(np.count_nonzero(col_used)))
+
+
+def encode_masked_rgba(u, v, w, alpha_values, pixels, bits=8, ranges=None):
+    """Encode the masked points of one level (1D arrays in mask order) into an RGBA image.
+
+    pixels is mask_pixels(mask), computed once per mask. u, v, w are
+    normalized to [0, 1] per level into RGB, alpha_values into A (1..254).
+    Points with any NaN, and image pixels outside the mask, are MISSING.
+    With bits=16 the image is uint16 (encode_rgba16(), MISSING16). Returns (image, ranges, missing_count) where ranges maps
+    'u'/'v'/'w'/'alpha' to its (min, max). Passing such a ranges dict
+    normalizes by those ranges instead of the level's own.
+    """
+    pixel_rows, pixel_cols, shape = pixels
+    ranges = ranges or {}
+    u_norm, u_min, u_max = normalize(u, ranges.get("u"))
+    v_norm, v_min, v_max = normalize(v, ranges.get("v"))
+    w_norm, w_min, w_max = normalize(w, ranges.get("w"))
+    alpha_norm, alpha_min, alpha_max = normalize(alpha_values, ranges.get("alpha"))
+    valid = ~(np.isnan(u) | np.isnan(v) | np.isnan(w) | np.isnan(alpha_values))
+    if bits == 16:
+        image = np.full(shape + (4,), MISSING16, dtype=np.uint16)
+        image[pixel_rows, pixel_cols] = encode_rgba16(u_norm, v_norm, w_norm, alpha_norm, valid)
+    else:
+        image = np.full(shape + (4,), MISSING, dtype=np.uint8)
+        image[pixel_rows, pixel_cols] = encode_rgba(u_norm, v_norm, w_norm, alpha_norm, valid)
+    ranges = {"u": (u_min, u_max), "v": (v_min, v_max), "w": (w_min, w_max), "alpha": (alpha_min, alpha_max)}
+    return image, ranges, int(valid.size - np.count_nonzero(valid))
@@ -0,0 +1,269 @@
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta, UTC
+import requests
+from cube_store import write_cube_store
+from downloader import Downloader
+from extract_levels_params_to_imgs import ATLAS, encode_level_images
+from grib_cache import GribCache
+from grib_stream import stream_extract_url
+from hrrr_extract import extract_window_levels
+from subset_download import download_subset
+
+# Where new cycles are looked for: the HRRR bucket on AWS, or a local folder
+# laid out the same way (hrrr.YYYYMMDD/conus/hrrr.tHHz.wrfnatfXX.grib2[.idx])
+SOURCE = "https://noaa-hrrr-bdp-pds.s3.amazonaws.com"
+
+# Per-hour outputs and the processed-hours state (downloads go to the GRIB cache)
+DATA_FOLDER = "HRRRdata_nat"
+INGEST_FOLDER = os.path.join(DATA_FOLDER, "ingest")
+STATE_FILE = os.path.join(INGEST_FOLDER, "ingest_state.json")
+
+# Forecast hours of each cycle to process, and how many past cycles are polled
+FORECAST_HOURS = range(2, 8)
+LOOKBACK_CYCLES = 3
+POLL_SECONDS = 120
+# Failed hours are retried on later polls up to this many times
+MAX_ATTEMPTS = 3
+
+# Remote files: only these parameters on these hybrid levels (see subset_download.py)
+SUBSET = True
+SUBSET_PARAMS = ["pres", "gh", "t", "u", "v", "w"]
+SUBSET_LEVELS = range(1, 23)
+# Remote files: decode and encode the subset while it's still downloading
+# (grib_stream.py). Hours are then streamed one after another.
+STREAM = True
+
+# Parameters extracted for every hour, and their units
+PARAM_UNITS = {
+    "pres": "Pa",
+    "gh": "gpm",
+    "t": "K",
+    "u": "m/s",
+    "v": "m/s",
+    "w": "Pa/s"
+}
+
+# Fort Worth bounding box (lon_min, lat_min, lon_max, lat_max)
+FORT_WORTH_BBOX = (-97.648, 32.742, -96.898, 33.231)
+
+# Number of processes decoding GRIB messages (1 decodes serially)
+WORKERS = os.cpu_count() or 1
+
+MAX_DOWNLOADS = 4
+
+FILE_RE = re.compile(r"hrrr\.(\d{8})/conus/hrrr\.t(\d{2})z\.wrfnatf(\d{2})\.grib2\.idx$")
+
+
+def is_remote(source):
+    return source.startswith(("http://", "https://"))
+
+
+def relative_path(cycle, fxx):
+    """Path of a wrfnat file below the source root, as on the HRRR bucket."""
+    return f"hrrr.{cycle:%Y%m%d}/conus/hrrr.t{cycle:%H}z.wrfnatf{fxx:02d}.grib2"
+
+
+def hour_key(cycle, fxx):
+    return f"{cycle:%Y%m%d%H}/f{fxx:02d}"
+
+
+def load_state(state_file):
+    """Processed/failed hours from the last run, or an empty state."""
+    if not os.path.exists(state_file):
+        return {"processed": {}, "failed": {}}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def save_state(state, state_file):
+    """Write the state atomically so a crash never leaves it half written."""
+    os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+    tmp_path = state_file + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_file)
+
+
+def is_pending(state, key):
+    if key in state["processed"]:
+        return False
+    return state["failed"].get(key, {}).get("attempts", 0) < MAX_ATTEMPTS
+
+
+def available_local(source, state):
+    """(cycle, fxx) of the files in a local source folder that aren't processed yet.
+
+    A file counts as landed once its .idx is there, since the .idx is
+    published after the GRIB2 file.
+    """
+    found = []
+    for idx_path in glob.glob(os.path.join(source, "hrrr.*", "conus", "hrrr.t*z.wrfnatf*.grib2.idx")):
+        match = FILE_RE.search(idx_path.replace(os.sep, "/"))
+        if not match:
+            continue
+        day, hour, fxx = match.groups()
+        cycle = datetime.strptime(day + hour, "%Y%m%d%H")
+        if int(fxx) in FORECAST_HOURS and is_pending(state, hour_key(cycle, int(fxx))):
+            found.append((cycle, int(fxx)))
+    return sorted(found)
+
+
+def available_remote(source, state, session, now=None):
+    """(cycle, fxx) of the last LOOKBACK_CYCLES cycles published on the bucket but not processed yet.
+
+    Forecast hours are published in order, so each cycle is probed (HEAD on
+    the .idx) only up to its first missing hour.
+    """
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    latest = now.replace(minute=0, second=0, microsecond=0)
+    found = []
+    for back in range(LOOKBACK_CYCLES):
+        cycle = latest - timedelta(hours=back)
+        for fxx in FORECAST_HOURS:
+            if not is_pending(state, hour_key(cycle, fxx)):
+                continue
+            response = session.head(f"{source}/{relative_path(cycle, fxx)}.idx", timeout=30)
+            if response.status_code != 200:
+                break
+            found.append((cycle, fxx))
+    return sorted(found)
+
+
+def fetch_hour(source, cycle, fxx, downloader, cache):
+    """Local path of the GRIB2 file for (cycle, fxx), downloading it into the GRIB cache for a remote source."""
+    rel_path = relative_path(cycle, fxx)
+    if not is_remote(source):
+        return os.path.join(source, rel_path)
+    url = f"{source}/{rel_path}"
+
+    def download(dest):
+        if SUBSET:
+            download_subset(url, url + ".idx", dest, SUBSET_PARAMS, SUBSET_LEVELS, session=downloader.session)
+        else:
+            downloader.fetch(url + ".idx", dest + ".idx")
+            downloader.fetch(url, dest, idx_path=dest + ".idx")
+
+    subset = (SUBSET_PARAMS, SUBSET_LEVELS) if SUBSET else (None, None)
+    return cache.fetch("hrrr", "nat", cycle, fxx, download, *subset)
+
+
+def process_hour(grib_path, out_folder):
+    """Extract the Fort Worth cubes and encoded level images of one file into out_folder."""
+    levels_params, window, mask, lats, lons = extract_window_levels(grib_path, PARAM_UNITS, FORT_WORTH_BBOX, WORKERS)
+    valid_levels = [level for level, params in levels_params.items() if all(p in params for p in PARAM_UNITS)]
+    write_cube_store(os.path.join(out_folder, "cubes"), levels_params, valid_levels, window, PARAM_UNITS,
+                     grib_path, lats, lons)
+    encode_level_images(levels_params, valid_levels, mask, lats, lons,
+                        os.path.join(out_folder, "levels_extracted_img_encoded"))
+    return grib_path
+
+
+def stream_hour(source, cycle, fxx, downloader, cache, out_folder):
+    """Like fetch_hour() + process_hour(), but decoding and encoding overlap the download.
+
+    Each level's image is encoded as soon as all its parameters are decoded
+    (in ATLAS mode the atlas is written once all levels are); the streamed
+    subset is stored in the GRIB cache on the way.
+    """
+    grib_path = cache.lookup("hrrr", "nat", cycle, fxx, SUBSET_PARAMS, SUBSET_LEVELS)
+    if grib_path is not None:
+        return process_hour(grib_path, out_folder)
+    url = f"{source}/{relative_path(cycle, fxx)}"
+    img_folder = os.path.join(out_folder, "levels_extracted_img_encoded")
+
+    def encode_level(level, params, mask, lats, lons):
+        encode_level_images({level: params}, [level], mask, lats, lons, img_folder)
+
+    grib_path = cache.reserve("hrrr", "nat", cycle, fxx, SUBSET_PARAMS, SUBSET_LEVELS)
+    levels_params, window, mask, lats, lons = stream_extract_url(
+        url, url + ".idx", SUBSET_PARAMS, FORT_WORTH_BBOX, SUBSET_LEVELS, WORKERS, None if ATLAS else encode_level,
+        grib_path, downloader.session)
+    cache.add("hrrr", "nat", cycle, fxx, SUBSET_PARAMS, SUBSET_LEVELS)
+    valid_levels = [level for level, params in levels_params.items() if all(p in params for p in PARAM_UNITS)]
+    if ATLAS:
+        encode_level_images(levels_params, valid_levels, mask, lats, lons, img_folder)
+    write_cube_store(os.path.join(out_folder, "cubes"), levels_params, valid_levels, window, PARAM_UNITS,
+                     grib_path, lats, lons)
+    return grib_path
+
+
+def poll_once(source=SOURCE, state_file=STATE_FILE, output_root=INGEST_FOLDER, downloader=None, cache=None):
+    """Process every newly available forecast hour once; returns the keys processed.
+
+    Downloads run concurrently and each file is extracted and encoded as soon
+    as it has landed (in STREAM mode, while it is landing). The state file is
+    updated after every hour.
+    """
+    state = load_state(state_file)
+    downloader = downloader or Downloader(max_workers=MAX_DOWNLOADS)
+    cache = cache or GribCache()
+    if is_remote(source):
+        pending = available_remote(source, state, downloader.session)
+    else:
+        pending = available_local(source, state)
+    if not pending:
+        return []
+    print(f"Found {len(pending)} new forecast hours: {[hour_key(c, f) for c, f in pending]}")
+
+    done = []
+
+    def run(cycle, fxx, work):
+        """Process one hour with work(out_folder) -> grib path and record the outcome."""
+        key = hour_key(cycle, fxx)
+        out_folder = os.path.join(output_root, f"{cycle:%Y%m%d}_t{cycle:%H}z", f"f{fxx:02d}")
+        try:
+            grib_path = work(out_folder)
+        except Exception as e:
+            failed = state["failed"].setdefault(key, {"attempts": 0})
+            failed["attempts"] += 1
+            failed["error"] = str(e)
+            print(f"Error processing {key} (attempt {failed['attempts']}/{MAX_ATTEMPTS}): {e}")
+        else:
+            state["failed"].pop(key, None)
+            state["processed"][key] = {
+                "grib": grib_path,
+                "output": out_folder,
+                "processed_at": datetime.now(UTC).isoformat(timespec="seconds"),
+            }
+            done.append(key)
+            print(f"Processed {key} -> {out_folder}")
+        save_state(state, state_file)
+
+    if STREAM and SUBSET and is_remote(source):
+        for cycle, fxx in pending:
+            run(cycle, fxx, lambda out_folder: stream_hour(source, cycle, fxx, downloader, cache, out_folder))
+        return done
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_DOWNLOADS) as executor:
+        futures = {executor.submit(fetch_hour, source, cycle, fxx, downloader, cache): (cycle, fxx)
+                   for cycle, fxx in pending}
+        for future in concurrent.futures.as_completed(futures):
+            cycle, fxx = futures[future]
+            run(cycle, fxx, lambda out_folder: process_hour(future.result(), out_folder))
+    return done
+
+
+def watch(source=SOURCE, state_file=STATE_FILE, output_root=INGEST_FOLDER, poll_seconds=POLL_SECONDS):
+    """Poll the source forever, processing new forecast hours as they are published."""
+    downloader = Downloader(max_workers=MAX_DOWNLOADS)
+    cache = GribCache()
+    print(f"Watching {source} for forecast hours {list(FORECAST_HOURS)} every {poll_seconds}s")
+    while True:
+        try:
+            poll_once(source, state_file, output_root, downloader, cache)
+        except requests.RequestException as e:
+            print(f"Warning: polling {source} failed ({e}), retrying next poll")
+        time.sleep(poll_seconds)
+
+
+def main():
+    watch()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Levels are stored as hive partitions (level=N/), one directory per level
+WRITE_PARTITIONING = ds.partitioning(pa.schema([("level", pa.int16())]), flavor="hive")
+# Read back with level as a dictionary-encoded column
+READ_PARTITIONING = ds.partitioning(pa.schema([("level", pa.dictionary(pa.int32(), pa.int16()))]),
+                                    flavor="hive", dictionaries="infer")
+
+
+def write_level_dataset(folder, level_frames):
+    """Write per-level tables into one Parquet dataset partitioned by level.
+
+    level_frames is a list of (level, DataFrame). All value columns are
+    stored as float32. The dataset replaces the folder as a whole (written to
+    folder + ".tmp", then swapped in), so partitions of levels that aren't
+    written again don't linger.
+    """
+    tables = []
+    for level, df in level_frames:
+        columns = {name: pa.array(df[name].to_numpy(), type=pa.float32()) for name in df.columns}
+        columns["level"] = pa.array([level] * len(df), type=pa.int16())
+        tables.append(pa.table(columns))
+    tmp_folder = folder.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    ds.write_dataset(pa.concat_tables(tables), tmp_folder, format="parquet",
+                     partitioning=WRITE_PARTITIONING, basename_template="part-{i}.parquet")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+
+
+def read_levels(folder, level_min=None, level_max=None, columns=None):
+    """Read the levels in [level_min, level_max] back as a DataFrame sorted by level.
+
+    The level filter is pushed down to the dataset scan, so only the
+    matching partitions are opened.
+    """
+    dataset = ds.dataset(folder, format="parquet", partitioning=READ_PARTITIONING)
+    level = ds.field("level")
+    filter_expr = None
+    if level_min is not None:
+        filter_expr = level >= level_min
+    if level_max is not None:
+        filter_expr = (level <= level_max) if filter_expr is None else filter_expr & (level <= level_max)
+    if columns is not None and "level" not in columns:
+        columns = ["level"] + list(columns)
+    df = dataset.to_table(columns=columns, filter=filter_expr).to_pandas()
+    df["level"] = df["level"].astype(int)
+    return df.sort_values("level", kind="stable", ignore_index=True)
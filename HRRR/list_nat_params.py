@@ -1,6 +1,8 @@
 import os
 import pygrib
 import numpy as np
+from grib_cache import resolve_grib_path
+from hrrr_grid import grid_from_message
 
 # Define the path to the GRIB2 file
 data_folder = "HRRRdata_nat"  # Folder where the native GRIB2 files are stored
@@ -10,9 +12,8 @@ grib_file_path = os.path.join(data_folder, grib_file_name)
 # Define output file path
 output_file = "hrrr_nat_parameters.txt"
 
-# Check if the GRIB2 file exists
-if not os.path.exists(grib_file_path):
-    raise FileNotFoundError(f"GRIB2 file not found: {grib_file_path}")
+# Check if the GRIB2 file exists, locally or in the GRIB cache
+grib_file_path = resolve_grib_path(grib_file_path)
 
 print(f"Reading native GRIB2 file: {grib_file_path}")
 print(f"Results will also be written to: {output_file}")
@@ -61,9 +62,13 @@ with open(output_file, 'w') as f:
             except Exception as e:
                 grid_info += f"Grid Size: Could not determine ({str(e)})\n"
             
-            # Extract lat/lon bounds
+            # Extract lat/lon bounds from the grid projection. The extremes of a
+            # Lambert conformal grid lie on its edges, so only those are computed.
             try:
-                lats, lons = first_grb.latlons()
+                grid = grid_from_message(first_grb)
+                edge_i = np.concatenate([np.arange(grid.nx), np.arange(grid.nx), np.zeros(grid.ny), np.full(grid.ny, grid.nx - 1)])
+                edge_j = np.concatenate([np.zeros(grid.nx), np.full(grid.nx, grid.ny - 1), np.arange(grid.ny), np.arange(grid.ny)])
+                lats, lons = grid.ij_to_latlon(edge_i, edge_j)
                 
                 lat_min = np.nanmin(lats)
                 lat_max = np.nanmax(lats)
@@ -74,7 +79,7 @@ with open(output_file, 'w') as f:
                     f"Geographic Extent:\n"
                     f"  Latitude:  min={lat_min:.4f}°, max={lat_max:.4f}°\n"
                     f"  Longitude: min={lon_min:.4f}°, max={lon_max:.4f}°\n"
-                    f"  Grid shape: {lats.shape}\n"
+                    f"  Grid shape: {grid.shape}\n"
                 )
                 grid_info += geo_extent
             except Exception as e:
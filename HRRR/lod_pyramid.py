@@ -0,0 +1,38 @@
+import numpy as np
+
+# Levels of detail of a 2D grid: LOD 0 is the full grid and each further LOD
+# halves both dimensions, down to a thumbnail. A coarse cell is the mean of the
+# valid (non-NaN) values of its 2 x 2 block and NaN only if all four are NaN.
+# Odd dimensions are padded with NaN, so the last row/column of cells averages
+# a 2 x 1 (or 1 x 1) block.
+
+
+def downsample_2x(values):
+    """NaN-aware 2 x 2 mean of a 2D array; shape (ceil(ny / 2), ceil(nx / 2))."""
+    ny, nx = values.shape
+    padded = np.full((ny + ny % 2, nx + nx % 2), np.nan, dtype=np.float64)
+    padded[:ny, :nx] = values
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+    mean = np.full(count.shape, np.nan)
+    np.divide(total, count, out=mean, where=count > 0)
+    return mean.astype(values.dtype if np.issubdtype(values.dtype, np.floating) else np.float32)
+
+
+def lod_shapes(shape, thumbnail_size=16):
+    """(ny, nx) of every LOD, from the full shape until neither dimension exceeds thumbnail_size."""
+    shapes = [tuple(int(n) for n in shape)]
+    while max(shapes[-1]) > thumbnail_size:
+        shapes.append(tuple(-(-n // 2) for n in shapes[-1]))
+    return shapes
+
+
+def build_pyramid(fields, thumbnail_size=16):
+    """LODs 1.. of a list of same-shape 2D fields (e.g. u, v, w): one list of downsampled fields per LOD."""
+    lods = []
+    for _ in lod_shapes(fields[0].shape, thumbnail_size)[1:]:
+        fields = [downsample_2x(field) for field in fields]
+        lods.append(fields)
+    return lods
@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from grib_index import decode_message, read_message_bytes
+from hrrr_grid import crop
+
+
+def _attach(name):
+    """Attach to an existing shared memory block without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the block with the resource tracker.
+        # Pool workers (fork, spawn or forkserver) share the parent's tracker, so
+        # this only repeats the parent's registration; unregistering here would
+        # drop it and make the parent's unlink() fail in the tracker (KeyError).
+        return shared_memory.SharedMemory(name=name)
+
+
+def _decode_chunk(args):
+    """Worker: decode a chunk of messages of one file and write the cropped windows into shared memory."""
+    shm_name, shape, grib_path, slots, entries, window = args
+    shm = _attach(shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        with open(grib_path, "rb") as f:
+            for slot, entry in zip(slots, entries):
+                grb = decode_message(read_message_bytes(f, entry))
+                out[slot] = crop(grb.values, window)
+        del out
+    finally:
+        shm.close()
+    return len(slots)
+
+
+def _chunks(tasks, n_chunks):
+    """Split (slot, grib_path, entry) tasks into chunks of one file each, in file-offset order."""
+    by_file = {}
+    for slot, (grib_path, entry) in enumerate(tasks):
+        by_file.setdefault(grib_path, []).append((slot, entry))
+    chunk_size = max(1, -(-len(tasks) // n_chunks))
+    for grib_path, items in by_file.items():
+        items.sort(key=lambda item: item[1]["offset"])
+        for start in range(0, len(items), chunk_size):
+            part = items[start:start + chunk_size]
+            yield grib_path, [slot for slot, _ in part], [entry for _, entry in part]
+
+
+def decode_parallel(tasks, window, max_workers=None):
+    """Decode GRIB messages in a process pool and return their cropped windows.
+
+    tasks is a list of (grib_path, idx entry) pairs. Each worker seeks to its
+    messages' byte ranges, decodes and crops them, and writes the windows
+    straight into one shared float32 block of shape (len(tasks), ny, nx), so
+    only the small windows ever cross process boundaries.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    ny = window[0].stop - window[0].start
+    nx = window[1].stop - window[1].start
+    shape = (len(tasks), ny, nx)
+    if not tasks:
+        return np.empty(shape, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+    try:
+        # A few chunks per worker keeps the pool busy when message sizes vary
+        jobs = [(shm.name, shape, grib_path, slots, entries, window)
+                for grib_path, slots, entries in _chunks(tasks, max_workers * 4)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(_decode_chunk, jobs):
+                pass
+        return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
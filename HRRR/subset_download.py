@@ -0,0 +1,77 @@
+import os
+import requests
+from grib_index import coalesce_ranges, format_idx_line, parse_idx_lines, select_messages
+
+CHUNK_SIZE = 1 << 20
+
+
+def iter_range(session, url, start, end):
+    """Yield the bytes [start, end] (end None: to end of file) of url in chunks as they arrive."""
+    byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end}"
+    with session.get(url, headers={"Range": byte_range}, stream=True, timeout=60) as response:
+        if response.status_code != 206:
+            raise IOError(f"Range request {byte_range} for {url} returned HTTP {response.status_code}")
+        received = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            yield chunk
+    if end is not None and received != end - start + 1:
+        raise IOError(f"Short read for {byte_range} of {url}: got {received} bytes")
+
+
+def fetch_range(session, url, start, end, f):
+    """Fetch bytes [start, end] (end None: to end of file) of url into an open file; returns bytes written."""
+    written = 0
+    for chunk in iter_range(session, url, start, end):
+        f.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def compact_idx_lines(selected):
+    """.idx lines for the selected messages stored back to back in file order."""
+    # Each new offset is the running total of the lengths before it
+    idx_lines = []
+    offset = 0
+    for n, entry in enumerate(sorted(selected, key=lambda e: e["offset"]), start=1):
+        idx_lines.append(format_idx_line(dict(entry, n=n, offset=offset)))
+        if entry["length"] is not None:
+            offset += entry["length"]
+    return idx_lines
+
+
+def fetch_selected(session, idx_url, short_names, levels=None):
+    """Fetch a remote .idx and return its entries for short_names on levels, in file order."""
+    response = session.get(idx_url, timeout=60)
+    response.raise_for_status()
+    selected = select_messages(parse_idx_lines(response.text.splitlines()), short_names, levels)
+    if not selected:
+        raise ValueError(f"No messages for {list(short_names)} on levels {levels} in {idx_url}")
+    selected.sort(key=lambda e: e["offset"])
+    return selected
+
+
+def download_subset(grib_url, idx_url, out_path, short_names, levels=None, session=None):
+    """Download only the selected hybrid-level messages of a remote GRIB2 file.
+
+    Fetches the .idx first, computes the byte ranges of the wanted messages,
+    issues one HTTP Range request per run of adjacent messages and writes a
+    compact GRIB2 file plus a matching .idx (offsets rewritten for the
+    compact file). Returns the number of bytes downloaded.
+    """
+    session = session or requests.Session()
+    selected = fetch_selected(session, idx_url, short_names, levels)
+    ranges = coalesce_ranges(selected)
+    print(f"Fetching {len(selected)} messages in {len(ranges)} range requests from {grib_url}")
+
+    tmp_path = out_path + ".part"
+    total = 0
+    with open(tmp_path, "wb") as f:
+        for start, end in ranges:
+            total += fetch_range(session, grib_url, start, end, f)
+    with open(tmp_path + ".idx", "w") as f:
+        f.write("\n".join(compact_idx_lines(selected)) + "\n")
+
+    os.replace(tmp_path, out_path)
+    os.replace(tmp_path + ".idx", out_path + ".idx")
+    return total
@@ -0,0 +1,113 @@
+import json
+import os
+import numpy as np
+from image_encoding import ENCODINGS, MISSING, MISSING16, encode_masked_rgba, load_encoded_png, save_encoded_png
+
+# Animated levels as a keyframe plus residual frames. All frames of a level are
+# quantized with one fixed range per channel, so consecutive frames differ only
+# where the field changed. Each residual frame holds (frame - previous frame)
+# mod 2^bits per channel, which decodes exactly (missing pixels included) with
+# frame = (previous + residual) mod 2^bits, and is mostly zeros, so its PNG is
+# much smaller than a full frame.
+TEMPORAL_ENCODING = "keyframe_delta"
+TEMPORAL_ENCODING_VERSION = 1
+
+
+def series_ranges(u, v, w, alpha_values):
+    """(min, max) of every channel over a whole time series, as the ranges dict of encode_masked_rgba()."""
+    return {name: (float(np.nanmin(values)), float(np.nanmax(values)))
+            for name, values in (("u", u), ("v", v), ("w", w), ("alpha", alpha_values))}
+
+
+def encode_frames(u, v, w, alpha_values, pixels, bits=8):
+    """Encode a (time, masked points) series of one level into (time, rows, cols, 4) RGBA frames.
+
+    Every frame uses the same series_ranges(); returns (frames, ranges).
+    """
+    ranges = series_ranges(u, v, w, alpha_values)
+    frames = np.stack([encode_masked_rgba(u[t], v[t], w[t], alpha_values[t], pixels, bits, ranges)[0]
+                       for t in range(len(u))])
+    return frames, ranges
+
+
+def frame_types(n_frames, keyframe_interval=0):
+    """'key' or 'delta' for each frame: the first frame is a keyframe, then every keyframe_interval-th (0: none)."""
+    return ["key" if t == 0 or (keyframe_interval and t % keyframe_interval == 0) else "delta"
+            for t in range(n_frames)]
+
+
+def delta_encode(frames, keyframe_interval=0):
+    """Keyframes as they are, every other frame as its residual to the previous frame (wrapping unsigned subtraction)."""
+    types = frame_types(len(frames), keyframe_interval)
+    return [frames[t] if kind == "key" else frames[t] - frames[t - 1] for t, kind in enumerate(types)]
+
+
+def delta_decode(encoded, types):
+    """Inverse of delta_encode(): the full frames, as one (time, rows, cols, 4) array."""
+    frames = np.empty((len(encoded),) + encoded[0].shape, dtype=encoded[0].dtype)
+    for t, (image, kind) in enumerate(zip(encoded, types)):
+        frames[t] = image if kind == "key" else frames[t - 1] + image
+    return frames
+
+
+def dequantize(frames, ranges, bits=8):
+    """Channel values of encoded frames as float32 (..., 4) arrays, NaN where a pixel is missing.
+
+    The inverse of the RGB quantization (within one step) and, for A, of the
+    alpha mapping onto 1..254 (1..65534 for 16 bits).
+    """
+    top, missing = (65535, MISSING16) if bits == 16 else (255, MISSING)
+    values = np.empty(frames.shape, dtype=np.float32)
+    for c, name in enumerate(("u", "v", "w")):
+        vmin, vmax = ranges[name]
+        values[..., c] = vmin + frames[..., c] / top * (vmax - vmin)
+    amin, amax = ranges["alpha"]
+    values[..., 3] = amin + (frames[..., 3].astype(np.float32) - 1) / (top - 2) * (amax - amin)
+    values[(frames == missing).all(axis=-1)] = np.nan
+    return values
+
+
+def write_animation(frames, ranges, meta, output_folder, name, frame_labels, bits=8, keyframe_interval=0,
+                    alpha_name="alpha"):
+    """Save a level's frames as {name}_{label}_key/_delta PNGs plus {name}_anim_meta.json; returns the paths.
+
+    meta holds the level's fixed fields (level, bounds, ...); the ranges
+    (alpha's under alpha_name, e.g. 'gh'), frame list and encoding are added here.
+    """
+    types = frame_types(len(frames), keyframe_interval)
+    paths = []
+    frame_entries = []
+    for image, kind, label in zip(delta_encode(frames, keyframe_interval), types, frame_labels):
+        img_paths = save_encoded_png(image, os.path.join(output_folder, f"{name}_{label}_{kind}"))
+        paths += img_paths
+        frame_entries.append({"label": label, "type": kind, "images": [os.path.basename(p) for p in img_paths]})
+    meta = {
+        **meta,
+        **{f"{alpha_name if channel == 'alpha' else channel}_{end}": value
+           for channel, (vmin, vmax) in ranges.items() for end, value in (("min", vmin), ("max", vmax))},
+        "alpha_name": alpha_name,
+        **ENCODINGS[bits],
+        "temporal_encoding": TEMPORAL_ENCODING,
+        "temporal_encoding_version": TEMPORAL_ENCODING_VERSION,
+        "frames": frame_entries,
+    }
+    meta_path = os.path.join(output_folder, f"{name}_anim_meta.json")
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return paths + [meta_path]
+
+
+def read_animation(meta_path):
+    """Decode an animation written by write_animation(); returns (frames, ranges, meta)."""
+    with open(meta_path) as f:
+        meta = json.load(f)
+    bits = 16 if meta["encoding"] == ENCODINGS[16]["encoding"] else 8
+    folder = os.path.dirname(meta_path)
+    encoded = []
+    for frame in meta["frames"]:
+        # save_encoded_png() names: {stem}.png or {stem}_hi.png/_lo.png
+        stem = os.path.join(folder, frame["images"][0][:-len("_hi.png" if bits == 16 else ".png")])
+        encoded.append(load_encoded_png(stem, bits))
+    ranges = {name: (meta[f"{name}_min"], meta[f"{name}_max"]) for name in ("u", "v", "w")}
+    ranges["alpha"] = (meta[f"{meta['alpha_name']}_min"], meta[f"{meta['alpha_name']}_max"])
+    return delta_decode(encoded, [frame["type"] for frame in meta["frames"]]), ranges, meta
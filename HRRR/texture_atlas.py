@@ -0,0 +1,75 @@
+import json
+import math
+import os
+import numpy as np
+from image_encoding import ENCODINGS, MISSING, MISSING16, save_encoded_png
+
+
+def pack_shelves(shapes, max_width=None):
+    """Shelf-pack (rows, cols) tile shapes into one image.
+
+    Tiles are placed tallest first, left to right on shelves no wider than
+    max_width (by default about the square root of the total area, so the
+    atlas comes out roughly square). Returns ((y, x) offset of each tile in
+    input order, (atlas_rows, atlas_cols)).
+    """
+    if max_width is None:
+        area = sum(rows * cols for rows, cols in shapes)
+        max_width = max(max(cols for _, cols in shapes), math.ceil(math.sqrt(area)))
+    offsets = [None] * len(shapes)
+    shelf_y = shelf_height = x = width = 0
+    for i in sorted(range(len(shapes)), key=lambda i: -shapes[i][0]):
+        rows, cols = shapes[i]
+        if x + cols > max_width and x > 0:
+            shelf_y += shelf_height
+            shelf_height = x = 0
+        offsets[i] = (shelf_y, x)
+        x += cols
+        width = max(width, x)
+        shelf_height = max(shelf_height, rows)
+    return offsets, (shelf_y + shelf_height, width)
+
+
+def build_atlas(images, max_width=None):
+    """Tile encoded level images (all uint8 or all uint16 RGBA) into one atlas array.
+
+    Pixels not covered by a tile are MISSING. Returns (atlas, offsets) with
+    offsets as in pack_shelves().
+    """
+    offsets, shape = pack_shelves([image.shape[:2] for image in images], max_width)
+    dtype = images[0].dtype
+    atlas = np.full(shape + (4,), MISSING16 if dtype == np.uint16 else MISSING, dtype=dtype)
+    for image, (y, x) in zip(images, offsets):
+        atlas[y:y + image.shape[0], x:x + image.shape[1]] = image
+    return atlas, offsets
+
+
+def write_atlas(images, metas, path_stem, max_width=None):
+    """Save levels as one atlas PNG (a _hi/_lo pair for 16-bit) plus {path_stem}_manifest.json.
+
+    The manifest lists one entry per level: its meta dict (the same fields as
+    the per-level _meta.json) plus x/y/width/height of its tile in pixels,
+    measured from the top-left corner of the atlas. Returns the paths written.
+    """
+    atlas, offsets = build_atlas(images, max_width)
+    img_paths = save_encoded_png(atlas, path_stem)
+    bits = 16 if atlas.dtype == np.uint16 else 8
+    manifest = {
+        "images": [os.path.basename(path) for path in img_paths],
+        "width": int(atlas.shape[1]),
+        "height": int(atlas.shape[0]),
+        **ENCODINGS[bits],
+        "tiles": [
+            {**meta, "x": int(x), "y": int(y), "width": int(image.shape[1]), "height": int(image.shape[0])}
+            for image, meta, (y, x) in zip(images, metas, offsets)
+        ],
+    }
+    manifest_path = path_stem + "_manifest.json"
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return img_paths + [manifest_path]
+
+
+def read_tile(atlas, tile):
+    """The level image of one manifest tile, as a view into the atlas array."""
+    return atlas[tile["y"]:tile["y"] + tile["height"], tile["x"]:tile["x"] + tile["width"]]
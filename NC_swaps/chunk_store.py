@@ -0,0 +1,180 @@
+import json
+import os
+import zlib
+import numpy as np
+
+# Chunked case store: a directory with an index.json and one compressed file per chunk
+#   {store}/index.json
+#   {store}/{group}/{name}/{i}.{j}.{k}    chunk (i, j, k) of a 3D (level, y, x) variable
+# 3D variables are chunked (1, tile, tile), 2D ones (tile, tile), 1D ones whole.
+# A chunk holds its values as little-endian floats of the variable's dtype (its
+# index entry's "dtype", e.g. "<f4" or "<f8"; edge chunks are clipped to the
+# variable's shape), byte-shuffled (all first bytes, then all second bytes, ...)
+# and zlib-compressed. Chunks with no valid value aren't written; the index lists
+# them as empty and they read back as NaN.
+INDEX_FILE = "index.json"
+FORMAT = "tru4dviz-chunks"
+VERSION = 2
+# dtype of variables added without one, and of every variable of version 1 stores
+DTYPE = "<f4"
+
+
+def create_store(folder, attrs=None, compression_level=6):
+    """Create an empty store folder; returns its index, to be filled with add_variable() and written with save_index()."""
+    os.makedirs(folder, exist_ok=True)
+    return {"format": FORMAT, "version": VERSION, "compression": "zlib",
+            "compression_level": compression_level, "shuffle": True, **(attrs or {}), "groups": {}}
+
+
+def default_chunks(shape, tile):
+    """(1, tile, tile) for 3D variables, (tile, tile) for 2D ones and the whole variable for 1D ones."""
+    if len(shape) == 1:
+        return [max(int(shape[0]), 1)]
+    return ([1] if len(shape) == 3 else []) + [tile, tile]
+
+
+def add_variable(index, group, name, shape, chunks, attrs=None, dtype=DTYPE):
+    """Add a variable of a floating-point dtype to a group of the index; returns its entry."""
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError(f"{name} must be stored as floats (NaN marks missing points), not {dtype}")
+    groups = index["groups"].setdefault(group, {"variables": {}})
+    entry = {"shape": [int(n) for n in shape], "chunks": [int(n) for n in chunks],
+             "dtype": dtype.newbyteorder("<").str, "empty_chunks": [], "stored_bytes": 0, **(attrs or {})}
+    groups["variables"][name] = entry
+    return entry
+
+
+def chunk_key(chunk_index):
+    return ".".join(str(i) for i in chunk_index)
+
+
+def _chunk_path(folder, group, name, chunk_index):
+    return os.path.join(folder, group, name, chunk_key(chunk_index))
+
+
+def variable_dtype(index, entry):
+    """numpy dtype of a variable's values (version 1 stores have one dtype for all)"""
+    return np.dtype(entry.get("dtype", index.get("dtype", DTYPE)))
+
+
+def _encode_chunk(values, dtype, level):
+    raw = np.ascontiguousarray(values, dtype=dtype).view(np.uint8).reshape(-1, dtype.itemsize)
+    return zlib.compress(np.ascontiguousarray(raw.T).tobytes(), level)
+
+
+def _decode_chunk(data, shape, dtype):
+    raw = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(shape)
+
+
+def write_block(folder, index, group, name, block, start):
+    """Write the chunks covering block, a part of a variable starting at the index tuple start.
+
+    start must lie on chunk boundaries, and block must end on chunk boundaries or
+    at the end of the variable, e.g. one level (1, y, x) of a 3D variable at (k, 0, 0).
+    """
+    entry = index["groups"][group]["variables"][name]
+    chunks = entry["chunks"]
+    dtype = variable_dtype(index, entry)
+    os.makedirs(os.path.join(folder, group, name), exist_ok=True)
+    block = np.asarray(block, dtype=dtype)
+    for offsets in np.ndindex(*[-(-n // c) for n, c in zip(block.shape, chunks)]):
+        part = block[tuple(slice(o * c, (o + 1) * c) for o, c in zip(offsets, chunks))]
+        chunk_index = [s // c + o for s, c, o in zip(start, chunks, offsets)]
+        if np.isnan(part).all():
+            entry["empty_chunks"].append(chunk_key(chunk_index))
+            continue
+        data = _encode_chunk(part, dtype, index["compression_level"])
+        with open(_chunk_path(folder, group, name, chunk_index), "wb") as f:
+            f.write(data)
+        entry["stored_bytes"] += len(data)
+
+
+def save_index(folder, index):
+    with open(os.path.join(folder, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+
+
+def read_index(folder):
+    """Index of a store, checking that this reader understands it."""
+    with open(os.path.join(folder, INDEX_FILE)) as f:
+        index = json.load(f)
+    if index.get("format") != FORMAT or index["version"] > VERSION:
+        raise ValueError(f"{folder} is not a {FORMAT} store of version <= {VERSION}")
+    return index
+
+
+def read_chunk(folder, index, group, name, chunk_index):
+    """One chunk of a variable in its dtype (clipped at the variable's edges), NaN if it is empty."""
+    entry = index["groups"][group]["variables"][name]
+    dtype = variable_dtype(index, entry)
+    shape = [min(c, n - i * c) for i, c, n in zip(chunk_index, entry["chunks"], entry["shape"])]
+    if chunk_key(chunk_index) in entry["empty_chunks"]:
+        return np.full(shape, np.nan, dtype=dtype)
+    with open(_chunk_path(folder, group, name, chunk_index), "rb") as f:
+        return _decode_chunk(f.read(), shape, dtype)
+
+
+def _normalize_selection(selection, shape):
+    """(start, stop) per axis and the axes indexed by an int (dropped from the result)."""
+    selection = tuple(selection) + (slice(None),) * (len(shape) - len(selection))
+    bounds = []
+    dropped = []
+    for axis, (sel, n) in enumerate(zip(selection, shape)):
+        if isinstance(sel, slice):
+            start, stop, step = sel.indices(n)
+            if step != 1:
+                raise ValueError("Sub-volume selections must be contiguous (slice step 1)")
+            bounds.append((start, max(start, stop)))
+        else:
+            i = int(sel) + (n if int(sel) < 0 else 0)
+            if not 0 <= i < n:
+                raise IndexError(f"Index {sel} out of range for axis {axis} of size {n}")
+            bounds.append((i, i + 1))
+            dropped.append(axis)
+    return bounds, tuple(dropped)
+
+
+def read_subvolume(folder, group, name, selection=(), index=None):
+    """Part of a variable, e.g. selection (k, slice(y0, y1), slice(x0, x1)) of a 3D one, in its dtype.
+
+    Only the chunks that intersect the selection are read and decompressed.
+    Pass the store's index to avoid re-reading it for every query.
+    """
+    index = index or read_index(folder)
+    entry = index["groups"][group]["variables"][name]
+    chunks = entry["chunks"]
+    bounds, dropped = _normalize_selection(selection, entry["shape"])
+    out = np.full([stop - start for start, stop in bounds], np.nan, dtype=variable_dtype(index, entry))
+    if out.size:
+        chunk_ranges = [range(start // c, -(-stop // c)) for (start, stop), c in zip(bounds, chunks)]
+        for chunk_index in np.ndindex(*[len(r) for r in chunk_ranges]):
+            chunk_index = [r[i] for r, i in zip(chunk_ranges, chunk_index)]
+            chunk = read_chunk(folder, index, group, name, chunk_index)
+            src = []
+            dst = []
+            for (start, stop), c, i in zip(bounds, chunks, chunk_index):
+                lo, hi = max(start, i * c), min(stop, (i + 1) * c)
+                src.append(slice(lo - i * c, hi - i * c))
+                dst.append(slice(lo - start, hi - start))
+            out[tuple(dst)] = chunk[tuple(src)]
+    return out.squeeze(axis=dropped) if dropped else out
+
+
+def coordinate_selection(index, group, altitude=None, latitude=None, longitude=None):
+    """(level, y, x) slices of the points of a group within (min, max) coordinate ranges (None: all).
+
+    Uses the group's 1D altitude/latitude/longitude coordinates from the index;
+    the result can be passed to read_subvolume() (its last two for 2D variables).
+    """
+    coords = index["groups"][group]
+    selection = []
+    for values, value_range in ((coords["altitudes"], altitude), (coords["latitudes"], latitude),
+                                (coords["longitudes"], longitude)):
+        if value_range is None:
+            selection.append(slice(None))
+            continue
+        inside = np.flatnonzero((np.asarray(values) >= value_range[0]) & (np.asarray(values) <= value_range[1]))
+        selection.append(slice(int(inside[0]), int(inside[-1]) + 1) if inside.size else slice(0, 0))
+    return tuple(selection)
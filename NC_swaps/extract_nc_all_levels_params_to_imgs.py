@@ -1,12 +1,21 @@
 import netCDF4 as nc
 import numpy as np
 import os
-from PIL import Image
+import re
+import sys
+import concurrent.futures
 import json
 
 # File paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Shared RGBA encoder from the HRRR scripts
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../HRRR"))
+from image_encoding import ENCODINGS, encode_rgba, encode_rgba16, normalize, save_encoded_png
+from encode_manifest import content_digest, is_current, load_manifest, manifest_entry, save_manifest
+from texture_atlas import write_atlas
+from nc_levels import read_filled
+
 # Define both NetCDF files to process - both have the same structure
 NC_FILES = [
     {
@@ -33,8 +42,76 @@ LEVEL_GROUPS = [
     ('high', 'u_high', 'v_high', 'w_high', 'altitude_high', 'latitude_high', 'longitude_high'),
 ]
 
-def process_nc_file(file_config):
-    """Process a single NetCDF file"""
+# Number of processes encoding levels (1 encodes serially)
+WORKERS = os.cpu_count() or 1
+
+# 8: one RGBA PNG per level; 16: 16 bits per channel as a hi-byte/lo-byte PNG pair
+# (finer steps for difference fields, see README-encoding.md)
+ENCODING_BITS = 8
+
+# None: one image + meta file per level; 'group': one atlas image + manifest per
+# group folder; 'case': one atlas + manifest per file, tiling all its groups
+ATLAS = None
+
+# Levels (and atlases) whose input slices and settings are unchanged since the last
+# run are skipped (encode_manifest.json in each output folder); True rewrites everything
+FORCE = False
+
+def read_origin(ds):
+    """lat_origin and lon_origin from the global attributes, or (None, None)"""
+    lat_origin = None
+    lon_origin = None
+    if hasattr(ds, 'origin for x,y meters'):
+        origin = getattr(ds, 'origin for x,y meters')
+        if isinstance(origin, str):
+            # Parse string like '[ 33.0265 -97.2725]'
+            nums = re.findall(r'[-+]?\d*\.\d+|\d+', origin)
+            if len(nums) >= 2:
+                lat_origin = float(nums[0])
+                lon_origin = float(nums[1])
+        elif hasattr(origin, '__len__') and len(origin) >= 2:
+            lat_origin = float(origin[0])
+            lon_origin = float(origin[1])
+    return lat_origin, lon_origin
+
+def read_group_grid(ds, group, lat_name, lon_name, alt_name):
+    """Grid size, lat/lon/altitude ranges and x/y_from_origin ranges of one level group"""
+    lat = ds.variables[lat_name][:]
+    lon = ds.variables[lon_name][:]
+    alt = ds.variables[alt_name][:]
+    
+    # Get bounding box
+    min_lat, max_lat = float(np.min(lat)), float(np.max(lat))
+    min_lon, max_lon = float(np.min(lon)), float(np.max(lon))
+    grid = {
+        "altitudes": [float(a) for a in alt],
+        "alt_min": float(np.min(alt)), "alt_max": float(np.max(alt)),
+        "min_lat": min_lat, "max_lat": max_lat,
+        "min_lon": min_lon, "max_lon": max_lon,
+        "num_lat": len(lat) if lat.ndim == 1 else lat.shape[0],
+        "num_lon": len(lon) if lon.ndim == 1 else lon.shape[1],
+    }
+    
+    # Compute min/max x_from_origin and y_from_origin
+    x_name = f"x_from_origin_{group}"
+    y_name = f"y_from_origin_{group}"
+    if x_name in ds.variables and y_name in ds.variables:
+        x_from_origin = ds.variables[x_name][:]
+        y_from_origin = ds.variables[y_name][:]
+        grid["min_x_from_origin"] = float(np.nanmin(x_from_origin))
+        grid["max_x_from_origin"] = float(np.nanmax(x_from_origin))
+        grid["min_y_from_origin"] = float(np.nanmin(y_from_origin))
+        grid["max_y_from_origin"] = float(np.nanmax(y_from_origin))
+    else:
+        # Use lat/lon as fallback
+        grid["min_x_from_origin"] = min_lon
+        grid["max_x_from_origin"] = max_lon
+        grid["min_y_from_origin"] = min_lat
+        grid["max_y_from_origin"] = max_lat
+    return grid
+
+def plan_nc_file(file_config):
+    """Read the per-group grid info of a NetCDF file and return one encoding task per level"""
     nc_path = file_config['path']
     file_name = file_config['name']
     output_prefix = file_config['output_prefix']
@@ -44,26 +121,14 @@ def process_nc_file(file_config):
     
     if not os.path.exists(nc_path):
         print(f"Warning: File not found: {nc_path}")
-        return
+        return []
     
+    tasks = []
     with nc.Dataset(nc_path) as ds:
         print(f"Variables in {file_name}: {list(ds.variables.keys())}")
         
         # Get lat_origin and lon_origin from global attributes if available
-        lat_origin = None
-        lon_origin = None
-        if hasattr(ds, 'origin for x,y meters'):
-            origin = getattr(ds, 'origin for x,y meters')
-            if isinstance(origin, str):
-                # Parse string like '[ 33.0265 -97.2725]'
-                import re
-                nums = re.findall(r'[-+]?\d*\.\d+|\d+', origin)
-                if len(nums) >= 2:
-                    lat_origin = float(nums[0])
-                    lon_origin = float(nums[1])
-            elif hasattr(origin, '__len__') and len(origin) >= 2:
-                lat_origin = float(origin[0])
-                lon_origin = float(origin[1])
+        lat_origin, lon_origin = read_origin(ds)
         
         # Process each level group
         for group, u_name, v_name, w_name, alt_name, lat_name, lon_name in LEVEL_GROUPS:
@@ -80,144 +145,195 @@ def process_nc_file(file_config):
             OUTPUT_FOLDER = os.path.join(SCRIPT_DIR, f'{group}_levels_img_encoded_{output_prefix}')
             os.makedirs(OUTPUT_FOLDER, exist_ok=True)
             
-            # Get all variables inside the with block
-            lat = ds.variables[lat_name][:]
-            lon = ds.variables[lon_name][:]
-            u = ds.variables[u_name][:]
-            v = ds.variables[v_name][:]
-            w = ds.variables[w_name][:]
-            alt = ds.variables[alt_name][:]
-            
-            # Handle x_from_origin and y_from_origin
-            x_name = f"x_from_origin_{group}"
-            y_name = f"y_from_origin_{group}"
-            if x_name in ds.variables and y_name in ds.variables:
-                x_from_origin = ds.variables[x_name][:]
-                y_from_origin = ds.variables[y_name][:]
-            else:
-                # Generate from lat/lon if not available
-                x_from_origin = None
-                y_from_origin = None
-            
-            # Get bounding box
-            min_lat, max_lat = float(np.min(lat)), float(np.max(lat))
-            min_lon, max_lon = float(np.min(lon)), float(np.max(lon))
-            alt_min = float(np.min(alt))
-            alt_max = float(np.max(alt))
-            num_lat = len(lat) if lat.ndim == 1 else lat.shape[0]
-            num_lon = len(lon) if lon.ndim == 1 else lon.shape[1]
+            # Only the coordinates are read here; u/v/w are read level by level by the workers
+            grid = read_group_grid(ds, group, lat_name, lon_name, alt_name)
+            alt = grid.pop("altitudes")
             
-            print(f"  Grid: {num_lat} x {num_lon}")
-            print(f"  Lat range: {min_lat:.6f} to {max_lat:.6f}")
-            print(f"  Lon range: {min_lon:.6f} to {max_lon:.6f}")
+            print(f"  Grid: {grid['num_lat']} x {grid['num_lon']}")
+            print(f"  Lat range: {grid['min_lat']:.6f} to {grid['max_lat']:.6f}")
+            print(f"  Lon range: {grid['min_lon']:.6f} to {grid['max_lon']:.6f}")
             print(f"  Levels: {len(alt)}")
             
-            # Process each level
             for k, a in enumerate(alt):
-                print(f"    Processing level {k} (altitude: {a})...")
-                
-                # Extract data for this level (3D: level, lat, lon)
-                u_k = u[k] if hasattr(u[k], 'filled') else u[k]
-                v_k = v[k] if hasattr(v[k], 'filled') else v[k]
-                w_k = w[k] if hasattr(w[k], 'filled') else w[k]
-                
-                # Handle masked arrays
-                if hasattr(u_k, 'filled'):
-                    u_k = u_k.filled(np.nan)
-                if hasattr(v_k, 'filled'):
-                    v_k = v_k.filled(np.nan)
-                if hasattr(w_k, 'filled'):
-                    w_k = w_k.filled(np.nan)
-                
-                # Normalize per level
-                u_min, u_max = np.nanmin(u_k), np.nanmax(u_k)
-                v_min, v_max = np.nanmin(v_k), np.nanmax(v_k)
-                w_min, w_max = np.nanmin(w_k), np.nanmax(w_k)
-                alt_val = float(a)
-                
-                u_norm = (u_k - u_min) / (u_max - u_min) if u_max > u_min else np.zeros_like(u_k)
-                v_norm = (v_k - v_min) / (v_max - v_min) if v_max > v_min else np.zeros_like(v_k)
-                w_norm = (w_k - w_min) / (w_max - w_min) if w_max > w_min else np.zeros_like(w_k)
-                alt_norm = (alt_val - alt_min) / (alt_max - alt_min) if alt_max > alt_min else 0.0
-                
-                # Encode alt_norm in [1, 254]
-                alpha = int(1 + alt_norm * 253)
-                
-                img_array = np.full((num_lat, num_lon, 4), 255, dtype=np.uint8)
-                missing_pixel_count = 0
-                
-                for i in range(num_lat):
-                    for j in range(num_lon):
-                        if (
-                            np.isnan(u_k[i, j]) or
-                            np.isnan(v_k[i, j]) or
-                            np.isnan(w_k[i, j])
-                        ):
-                            missing_pixel_count += 1
-                            continue
-                        img_array[i, j, 0] = int(np.clip(u_norm[i, j] * 255, 0, 255))
-                        img_array[i, j, 1] = int(np.clip(v_norm[i, j] * 255, 0, 255))
-                        img_array[i, j, 2] = int(np.clip(w_norm[i, j] * 255, 0, 255))
-                        img_array[i, j, 3] = np.clip(alpha, 1, 254)
-                
-                img = Image.fromarray(img_array, mode='RGBA')
-                img_path = os.path.join(OUTPUT_FOLDER, f"{group}_level{k}_img.png")
-                img.save(img_path)
-                print(f"    Saved: {img_path}")
-                print(f"    Missing pixels: {missing_pixel_count}/{num_lat * num_lon}")
-                
-                # Compute min/max x_from_origin and y_from_origin
-                if x_from_origin is not None and y_from_origin is not None:
-                    min_x_from_origin = float(np.nanmin(x_from_origin))
-                    max_x_from_origin = float(np.nanmax(x_from_origin))
-                    min_y_from_origin = float(np.nanmin(y_from_origin))
-                    max_y_from_origin = float(np.nanmax(y_from_origin))
-                else:
-                    # Use lat/lon as fallback
-                    min_x_from_origin = min_lon
-                    max_x_from_origin = max_lon
-                    min_y_from_origin = min_lat
-                    max_y_from_origin = max_lat
-                
-                meta = {
-                    #"source": file_name,
+                tasks.append({
+                    "path": nc_path,
+                    "output_prefix": output_prefix,
+                    "var_names": (u_name, v_name, w_name),
+                    "output_folder": OUTPUT_FOLDER,
+                    "k": k,
+                    "altitude": float(a),
                     "group": group,
-                    "level_index": int(k),
-                    "altitude": float(alt_val),
-                    "u_min": float(u_min), "u_max": float(u_max),
-                    "v_min": float(v_min), "v_max": float(v_max),
-                    "w_min": float(w_min), "w_max": float(w_max),
-                    "alt_min": float(alt_min), "alt_max": float(alt_max),
-                    "min_lat": float(min_lat), "max_lat": float(max_lat),
-                    "min_lon": float(min_lon), "max_lon": float(max_lon),
-                    "num_lat": int(num_lat), "num_lon": int(num_lon),
-                    "debug_scale": 1,
-                    "min_x_from_origin": min_x_from_origin,
-                    "max_x_from_origin": max_x_from_origin,
-                    "min_y_from_origin": min_y_from_origin,
-                    "max_y_from_origin": max_y_from_origin,
+                    **grid,
                     "lat_origin": lat_origin,
-                    "lon_origin": lon_origin
-                }
-                
-                meta_path = os.path.join(OUTPUT_FOLDER, f"{group}_level{k}_meta.json")
-                with open(meta_path, 'w') as f:
-                    json.dump(meta, f, indent=2)
-                print(f"    Saved metadata: {meta_path}")
-
-# Process both files
-for file_config in NC_FILES:
-    process_nc_file(file_config)
-
-print("\n=== Processing Complete ===")
-print("Both OpenFOAM and HRRR data have been processed and encoded to images.")
-print("Output folders:")
-print("  - low_levels_img_encoded_cfd/")
-print("  - mid_levels_img_encoded_cfd/")
-print("  - high_levels_img_encoded_cfd/")
-print("  - low_levels_img_encoded_hrrr/")
-print("  - mid_levels_img_encoded_hrrr/")
-print("  - high_levels_img_encoded_hrrr/")
-print("  - low_levels_img_encoded_diff-cfd-hrrr/")
-print("  - mid_levels_img_encoded_diff-cfd-hrrr/")
-print("  - high_levels_img_encoded_diff-cfd-hrrr/") 
\ No newline at end of file
+                    "lon_origin": lon_origin,
+                    "bits": ENCODING_BITS,
+                })
+    return tasks
+
+def read_level_fields(task):
+    """u, v, w of the task's level (3D variables: level, lat, lon), masked values as NaN"""
+    with nc.Dataset(task["path"]) as ds:
+        return [read_filled(ds, name, task["k"]) for name in task["var_names"]]
+
+def level_digest(task, fields):
+    """Digest of everything a level's outputs depend on: its u/v/w slices and the encoder settings"""
+    settings = {key: value for key, value in task.items()
+                if key not in ("path", "output_folder", "output_prefix", "previous")}
+    return content_digest(fields, settings)
+
+def level_name(task):
+    return f"{task['group']}_level{task['k']}"
+
+def encode_level_image(task, fields):
+    """Encode one level of one group; returns (RGBA array, meta dict, log lines)"""
+    k = task["k"]
+    group = task["group"]
+    alt_val = task["altitude"]
+    alt_min, alt_max = task["alt_min"], task["alt_max"]
+    log = [f"    Processing level {k} (altitude: {alt_val}) of {os.path.basename(task['path'])} {group}..."]
+    u_k, v_k, w_k = fields
+    
+    # Normalize per level
+    u_norm, u_min, u_max = normalize(u_k)
+    v_norm, v_min, v_max = normalize(v_k)
+    w_norm, w_min, w_max = normalize(w_k)
+    alt_norm = (alt_val - alt_min) / (alt_max - alt_min) if alt_max > alt_min else 0.0
+    
+    # RGB: u, v, w; A: altitude in [1, 254]; 255 in all channels where data is missing
+    valid = ~(np.isnan(u_k) | np.isnan(v_k) | np.isnan(w_k))
+    encode = encode_rgba16 if task["bits"] == 16 else encode_rgba
+    img_array = encode(u_norm, v_norm, w_norm, alt_norm, valid)
+    missing_pixel_count = int(valid.size - np.count_nonzero(valid))
+    log.append(f"    Missing pixels: {missing_pixel_count}/{task['num_lat'] * task['num_lon']}")
+    
+    meta = {
+        #"source": file_name,
+        "group": group,
+        "level_index": int(k),
+        "altitude": float(alt_val),
+        "u_min": float(u_min), "u_max": float(u_max),
+        "v_min": float(v_min), "v_max": float(v_max),
+        "w_min": float(w_min), "w_max": float(w_max),
+        "alt_min": float(alt_min), "alt_max": float(alt_max),
+        "min_lat": float(task["min_lat"]), "max_lat": float(task["max_lat"]),
+        "min_lon": float(task["min_lon"]), "max_lon": float(task["max_lon"]),
+        "num_lat": int(task["num_lat"]), "num_lon": int(task["num_lon"]),
+        "debug_scale": 1,
+        "min_x_from_origin": task["min_x_from_origin"],
+        "max_x_from_origin": task["max_x_from_origin"],
+        "min_y_from_origin": task["min_y_from_origin"],
+        "max_y_from_origin": task["max_y_from_origin"],
+        "lat_origin": task["lat_origin"],
+        "lon_origin": task["lon_origin"],
+        **ENCODINGS[task["bits"]]
+    }
+    return img_array, meta, log
+
+def encode_level(task):
+    """Encode one level of one group into its RGBA image and meta file.
+
+    Skipped if the level's digest matches task["previous"] (its manifest entry)
+    and the files are still there. Returns (log lines, manifest entry).
+    """
+    fields = read_level_fields(task)
+    digest = level_digest(task, fields)
+    OUTPUT_FOLDER = task["output_folder"]
+    if is_current(task["previous"], OUTPUT_FOLDER, digest):
+        return [f"    Unchanged: {level_name(task)} of {os.path.basename(task['path'])}"], task["previous"]
+    img_array, meta, log = encode_level_image(task, fields)
+    group, k = task["group"], task["k"]
+    img_paths = save_encoded_png(img_array, os.path.join(OUTPUT_FOLDER, f"{group}_level{k}_img"))
+    log.append(f"    Saved: {', '.join(img_paths)}")
+    
+    meta_path = os.path.join(OUTPUT_FOLDER, f"{group}_level{k}_meta.json")
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    log.append(f"    Saved metadata: {meta_path}")
+    return log, manifest_entry(digest, img_paths + [meta_path])
+
+def encode_atlas_level(task):
+    """Encode one level for an atlas; returns (RGBA array, meta dict, log lines, digest)"""
+    fields = read_level_fields(task)
+    return encode_level_image(task, fields) + (level_digest(task, fields),)
+
+def atlas_path_stem(task):
+    """Path stem of the atlas a level goes into in ATLAS mode"""
+    if ATLAS == 'case':
+        folder = os.path.join(SCRIPT_DIR, f"atlas_img_encoded_{task['output_prefix']}")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{task['output_prefix']}_atlas")
+    return os.path.join(task["output_folder"], f"{task['group']}_atlas")
+
+def write_atlases(tasks, results):
+    """Group the encoded levels by atlas and write each atlas whose levels changed, with its manifest"""
+    atlases = {}
+    for task, (img_array, meta, log, digest) in zip(tasks, results):
+        print("\n".join(log))
+        images, metas, digests = atlases.setdefault(atlas_path_stem(task), ([], [], []))
+        images.append(img_array)
+        metas.append(meta)
+        digests.append(digest)
+    for path_stem, (images, metas, digests) in atlases.items():
+        folder, name = os.path.split(path_stem)
+        artifacts = load_manifest(folder)
+        digest = content_digest([], {"atlas": name, "levels": digests})
+        if not FORCE and is_current(artifacts.get(name), folder, digest):
+            print(f"  Unchanged atlas: {path_stem}")
+            continue
+        paths = write_atlas(images, metas, path_stem)
+        artifacts[name] = manifest_entry(digest, paths)
+        save_manifest(folder, artifacts)
+        print(f"  Saved atlas of {len(images)} levels: {', '.join(paths)}")
+
+def record_levels(tasks, entries):
+    """Store the manifest entries of the encoded levels in their folders' manifests"""
+    folders = {}
+    for task, entry in zip(tasks, entries):
+        folders.setdefault(task["output_folder"], {})[level_name(task)] = entry
+    for folder, entries in folders.items():
+        artifacts = load_manifest(folder)
+        artifacts.update(entries)
+        save_manifest(folder, artifacts)
+
+def main():
+    # One task per (file, group, level)
+    tasks = [task for file_config in NC_FILES for task in plan_nc_file(file_config)]
+    
+    # Manifest entry of every level from the last run
+    manifests = {}
+    for task in tasks:
+        folder = task["output_folder"]
+        if folder not in manifests:
+            manifests[folder] = {} if FORCE else load_manifest(folder)
+        task["previous"] = manifests[folder].get(level_name(task))
+    
+    print(f"\nEncoding {len(tasks)} levels with {WORKERS} workers...")
+    # In ATLAS mode the workers return the encoded levels and the atlases are written here
+    work = encode_atlas_level if ATLAS else encode_level
+    if WORKERS > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS) as executor:
+            results = list(executor.map(work, tasks))
+    else:
+        results = [work(task) for task in tasks]
+    if ATLAS:
+        write_atlases(tasks, results)
+    else:
+        for log, _ in results:
+            print("\n".join(log))
+        record_levels(tasks, [entry for _, entry in results])
+    
+    print("\n=== Processing Complete ===")
+    print("Both OpenFOAM and HRRR data have been processed and encoded to images.")
+    print("Output folders:")
+    print("  - low_levels_img_encoded_cfd/")
+    print("  - mid_levels_img_encoded_cfd/")
+    print("  - high_levels_img_encoded_cfd/")
+    print("  - low_levels_img_encoded_hrrr/")
+    print("  - mid_levels_img_encoded_hrrr/")
+    print("  - high_levels_img_encoded_hrrr/")
+    print("  - low_levels_img_encoded_diff-cfd-hrrr/")
+    print("  - mid_levels_img_encoded_diff-cfd-hrrr/")
+    print("  - high_levels_img_encoded_diff-cfd-hrrr/")
+
+if __name__ == "__main__":
+    main()
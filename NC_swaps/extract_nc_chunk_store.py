@@ -0,0 +1,119 @@
+import netCDF4 as nc
+import numpy as np
+import os
+import shutil
+import time
+from extract_nc_all_levels_params_to_imgs import NC_FILES, SCRIPT_DIR, read_origin
+from chunk_store import add_variable, create_store, default_chunks, read_index, read_subvolume, save_index, write_block
+from nc_levels import GROUPS, has_group, read_filled
+
+# Rewrite each case NetCDF file into a chunked, compressed directory store
+# ({output_prefix}_chunks/, see chunk_store.py) that serves sub-volume queries
+# (one tile at one altitude, a lat/lon/altitude box, ...) by decompressing only
+# the chunks they touch.
+OUTPUT_FOLDER = os.path.join(SCRIPT_DIR, 'chunk_stores')
+
+# 3D parameters stored per group (the ones a file doesn't have are skipped)
+PARAMS = ['u', 'v', 'w', 'tke']
+# 2D/1D variables stored per group
+GRID_VARS = ['x_from_origin', 'y_from_origin']
+
+# Chunk width and height in points; 3D variables are chunked (1 level, TILE_SIZE, TILE_SIZE)
+TILE_SIZE = 64
+# zlib level, 1 (fastest) to 9 (smallest)
+COMPRESSION_LEVEL = 6
+
+def store_group(ds, out_dir, index, group):
+    """Add a group's coordinates and variables to the store, reading one level at a time"""
+    coords = {name: read_filled(ds, f'{name}_{group}') for name in ('altitude', 'latitude', 'longitude')}
+    index["groups"][group] = {
+        "altitudes": coords['altitude'].tolist(),
+        "latitudes": coords['latitude'].tolist(),
+        "longitudes": coords['longitude'].tolist(),
+        "variables": {},
+    }
+    for name in GRID_VARS:
+        var_name = f'{name}_{group}'
+        if var_name in ds.variables:
+            values = read_filled(ds, var_name)
+            add_variable(index, group, name, values.shape, default_chunks(values.shape, TILE_SIZE), dtype=values.dtype)
+            write_block(out_dir, index, group, name, values, (0,) * values.ndim)
+    for name in PARAMS:
+        var_name = f'{name}_{group}'
+        if var_name not in ds.variables:
+            continue
+        shape = ds.variables[var_name].shape
+        units = getattr(ds.variables[var_name], 'units', None)
+        # Stored in the dtype read_filled() returns: the file's own float dtype (float32 for integer variables)
+        dtype = np.result_type(ds.variables[var_name].dtype, np.float32)
+        add_variable(index, group, name, shape, default_chunks(shape, TILE_SIZE),
+                     {"units": units} if units else None, dtype=dtype)
+        for k in range(shape[0]):
+            write_block(out_dir, index, group, name, read_filled(ds, var_name, k)[None], (k, 0, 0))
+
+def export_nc_file(file_config):
+    """Write the chunk store of one NetCDF file; returns its folder, or None if the file is missing"""
+    nc_path = file_config['path']
+    print(f"\n=== Converting {file_config['name'].upper()} file ===")
+    if not os.path.exists(nc_path):
+        print(f"Warning: File not found: {nc_path}")
+        return None
+
+    out_dir = os.path.join(OUTPUT_FOLDER, f"{file_config['output_prefix']}_chunks")
+    # Written next to the old store and swapped in at the end, so readers never see a partial store
+    part_dir = out_dir + '.part'
+    shutil.rmtree(part_dir, ignore_errors=True)
+    with nc.Dataset(nc_path) as ds:
+        lat_origin, lon_origin = read_origin(ds)
+        attrs = {"source": os.path.basename(nc_path), "lat_origin": lat_origin, "lon_origin": lon_origin}
+        index = create_store(part_dir, attrs, COMPRESSION_LEVEL)
+        for group in GROUPS:
+            if not has_group(ds, group):
+                print(f"  Skipping {group}: Missing u/v/w or altitude")
+                continue
+            store_group(ds, part_dir, index, group)
+            for name, entry in index["groups"][group]["variables"].items():
+                print(f"  {group} {name}: {entry['shape']} {entry['dtype']} in chunks of {entry['chunks']}, "
+                      f"{entry['stored_bytes'] / 1e6:.2f} MB ({len(entry['empty_chunks'])} empty chunks)")
+        save_index(part_dir, index)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(part_dir, out_dir)
+    total = sum(entry['stored_bytes'] for group in index["groups"].values() for entry in group["variables"].values())
+    print(f"  Saved: {out_dir} ({total / 1e6:.1f} MB, NetCDF {os.path.getsize(nc_path) / 1e6:.1f} MB)")
+    return out_dir
+
+def verify_store(out_dir, nc_path):
+    """Compare every level read from the store with the NetCDF file, then time a one-tile query"""
+    index = read_index(out_dir)
+    with nc.Dataset(nc_path) as ds:
+        for group, group_index in index["groups"].items():
+            for name, entry in group_index["variables"].items():
+                levels = range(entry["shape"][0]) if len(entry["shape"]) == 3 else [slice(None)]
+                for k in levels:
+                    expected = read_filled(ds, f'{name}_{group}', k)
+                    if not np.array_equal(read_subvolume(out_dir, group, name, (k,), index), expected, equal_nan=True):
+                        raise ValueError(f"{group} {name} level {k} of {out_dir} doesn't match {nc_path}")
+            print(f"  Verified {group}: {', '.join(group_index['variables'])}")
+
+        # One tile in the middle of the first group's lowest level
+        group = next(iter(index["groups"]))
+        _, ny, nx = index["groups"][group]["variables"]['u']["shape"]
+        y0, x0 = max(ny // 2 - TILE_SIZE // 2, 0), max(nx // 2 - TILE_SIZE // 2, 0)
+        selection = (0, slice(y0, y0 + TILE_SIZE), slice(x0, x0 + TILE_SIZE))
+        start = time.perf_counter()
+        tile = read_subvolume(out_dir, group, 'u', selection, index)
+        query_time = time.perf_counter() - start
+        start = time.perf_counter()
+        read_filled(ds, f'u_{group}')
+        full_time = time.perf_counter() - start
+        print(f"  Query {group} u {tile.shape}: {query_time * 1000:.1f} ms "
+              f"(whole NetCDF variable: {full_time * 1000:.1f} ms)")
+
+def main():
+    for file_config in NC_FILES:
+        out_dir = export_nc_file(file_config)
+        if out_dir:
+            verify_store(out_dir, file_config['path'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+import pathlib
+import time
+from nc_levels import read_filled
+
+# File paths
+SCRIPT_DIR = pathlib.Path(__file__).parent.resolve()
+NC_PATH = os.path.join(SCRIPT_DIR, '../NCdata/openfoam_usa-tx-elizabethtown_2023-02-14T15-00-00.nc')
+
+# (variable suffix, output file name without extension) of each layer group
+LAYER_GROUPS = [
+    ('low', 'low_layers_grid'),
+    ('mid', 'middle_layers_grid'),
+    ('high', 'high_layers_grid'),
+]
+
+# 3D parameters exported per grid point
+PARAMS = ['u', 'v', 'w', 'tke']
+
+# 'parquet' or 'csv'. Parquet is the fast path (columns go to Arrow as they are).
+# CSV reproduces the old per-layer scripts' text exactly, but formatting every
+# value as text keeps it many times slower than Parquet.
+OUTPUT_FORMAT = 'parquet'
+
+# Levels read and written per chunk; memory stays at CHUNK_LEVELS levels of one group
+CHUNK_LEVELS = 4
+
+def grid_2d(values, shape, axis):
+    """x/y_from_origin as a (lat, lon) array; 1D values run along the given axis"""
+    if values.ndim == 2:
+        return values
+    return np.broadcast_to(values[:, None] if axis == 0 else values[None, :], shape)
+
+def layer_chunks(ds, suffix, chunk_levels=CHUNK_LEVELS):
+    """Yield the rows of a layer group as DataFrames of chunk_levels levels each.
+
+    Rows run over (altitude, latitude, longitude) in that order, with columns
+    altitude, latitude, longitude, x/y_from_origin_{suffix} and
+    {param}_{suffix}. Every column is built by broadcasting: coordinates with
+    np.repeat/np.tile, parameters by flattening the (level, lat, lon) slice.
+    """
+    lat = read_filled(ds, f'latitude_{suffix}')
+    lon = read_filled(ds, f'longitude_{suffix}')
+    alt = read_filled(ds, f'altitude_{suffix}')
+    shape = (len(lat), len(lon))
+    x_from_origin = grid_2d(read_filled(ds, f'x_from_origin_{suffix}'), shape, 1).ravel()
+    y_from_origin = grid_2d(read_filled(ds, f'y_from_origin_{suffix}'), shape, 0).ravel()
+    # Coordinates of one level, repeated for every level of a chunk
+    lat_level = np.repeat(lat, len(lon))
+    lon_level = np.tile(lon, len(lat))
+    for k0 in range(0, len(alt), chunk_levels):
+        k1 = min(k0 + chunk_levels, len(alt))
+        n_levels = k1 - k0
+        columns = {
+            'altitude': np.repeat(alt[k0:k1], lat_level.size),
+            'latitude': np.tile(lat_level, n_levels),
+            'longitude': np.tile(lon_level, n_levels),
+            f'x_from_origin_{suffix}': np.tile(x_from_origin, n_levels),
+            f'y_from_origin_{suffix}': np.tile(y_from_origin, n_levels),
+        }
+        for param in PARAMS:
+            columns[f'{param}_{suffix}'] = read_filled(ds, f'{param}_{suffix}', slice(k0, k1)).ravel()
+        # float64, so the CSV values print as before (float32 values widened to float)
+        yield pd.DataFrame({name: values.astype(np.float64) for name, values in columns.items()})
+
+def export_layer(ds, suffix, out_path, output_format=OUTPUT_FORMAT, chunk_levels=CHUNK_LEVELS):
+    """Write a layer group to Parquet or CSV one chunk at a time; returns the number of rows.
+
+    Parquet chunks go through Arrow's ParquetWriter (NaN as NaN), with only the
+    repeated coordinate columns dictionary-encoded. CSV chunks are appended
+    with pandas' to_csv, so the text is the same as the old per-layer scripts
+    wrote (NaN as empty fields), at a fraction of Parquet's speed.
+    """
+    n_rows = 0
+    parquet_writer = None
+    with open(out_path, 'wb') as f:
+        try:
+            for chunk in layer_chunks(ds, suffix, chunk_levels):
+                if output_format == 'parquet':
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if parquet_writer is None:
+                        coordinates = [name for name in table.column_names if name.rsplit('_', 1)[0] not in PARAMS]
+                        parquet_writer = pq.ParquetWriter(f, table.schema, use_dictionary=coordinates)
+                    parquet_writer.write_table(table)
+                else:
+                    chunk.to_csv(f, index=False, header=n_rows == 0)
+                n_rows += len(chunk)
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+    return n_rows
+
+def main():
+    with nc.Dataset(NC_PATH) as ds:
+        for suffix, output_name in LAYER_GROUPS:
+            missing_vars = [name for name in [f'{p}_{suffix}' for p in PARAMS] + [f'altitude_{suffix}']
+                            if name not in ds.variables]
+            if missing_vars:
+                print(f"Skipping {suffix}: Missing variables {missing_vars}")
+                continue
+            out_path = os.path.join(SCRIPT_DIR, f'{output_name}.{OUTPUT_FORMAT}')
+            start = time.perf_counter()
+            n_rows = export_layer(ds, suffix, out_path, OUTPUT_FORMAT)
+            print(f"Saved {suffix} layer grid with parameters to {out_path} "
+                  f"({n_rows} rows in {time.perf_counter() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
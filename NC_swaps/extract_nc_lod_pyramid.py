@@ -0,0 +1,94 @@
+import concurrent.futures
+import json
+import os
+from extract_nc_all_levels_params_to_imgs import (FORCE, NC_FILES, WORKERS, encode_level_image, level_digest,
+                                                  level_name, plan_nc_file, read_level_fields)
+from encode_manifest import is_current, load_manifest, save_manifest
+from image_encoding import save_encoded_png
+from lod_pyramid import build_pyramid, lod_shapes
+
+# Coarser levels of detail of every encoded level, so viewers can show a coarse
+# level first and refine. LOD n halves the grid n times (lod_pyramid.py) and is
+# written to {group}_levels_img_encoded_{prefix}/lod{n}/ in the same layout as
+# the full-resolution images of extract_nc_all_levels_params_to_imgs.py (LOD 0,
+# the group folder itself). {group}_lods.json in the group folder lists the LODs.
+
+# Halve the grid until neither dimension is larger than this
+THUMBNAIL_SIZE = 16
+
+def lod_folder(task, lod):
+    return os.path.join(task["output_folder"], f"lod{lod}")
+
+def lods_name(task):
+    """Manifest entry name of a level's LOD images"""
+    return f"{level_name(task)}_lods"
+
+def encode_level_lods(task):
+    """Encode LODs 1.. of one level into their folders.
+
+    Skipped if the level's digest matches task["previous"] and the files are
+    still there. Returns (log lines, manifest entry).
+    """
+    fields = read_level_fields(task)
+    digest = level_digest(task, fields)
+    folder = task["output_folder"]
+    if is_current(task["previous"], folder, digest):
+        return [f"    Unchanged: {lods_name(task)} of {os.path.basename(task['path'])}"], task["previous"]
+    log = []
+    paths = []
+    for lod, lod_fields in enumerate(build_pyramid(fields, task["thumbnail_size"]), start=1):
+        num_lat, num_lon = lod_fields[0].shape
+        lod_task = {**task, "num_lat": num_lat, "num_lon": num_lon}
+        img_array, meta, _ = encode_level_image(lod_task, lod_fields)
+        meta.update({"lod": lod, "lod_scale": 2 ** lod})
+        path_stem = os.path.join(lod_folder(task, lod), f"{task['group']}_level{task['k']}")
+        paths += save_encoded_png(img_array, f"{path_stem}_img")
+        with open(f"{path_stem}_meta.json", 'w') as f:
+            json.dump(meta, f, indent=2)
+        paths.append(f"{path_stem}_meta.json")
+        log.append(f"    {level_name(task)} LOD {lod}: {num_lat} x {num_lon}")
+    return log, {"digest": digest, "outputs": [os.path.relpath(path, folder) for path in paths]}
+
+def write_lods_index(task):
+    """{group}_lods.json: folder and grid size of every LOD of a group, coarsest last"""
+    shapes = lod_shapes((task["num_lat"], task["num_lon"]), task["thumbnail_size"])
+    lods = [{"lod": lod, "folder": "." if lod == 0 else f"lod{lod}", "num_lat": ny, "num_lon": nx, "lod_scale": 2 ** lod}
+            for lod, (ny, nx) in enumerate(shapes)]
+    path = os.path.join(task["output_folder"], f"{task['group']}_lods.json")
+    with open(path, 'w') as f:
+        json.dump({"group": task["group"], "thumbnail_size": task["thumbnail_size"], "lods": lods}, f, indent=2)
+    return path
+
+def main():
+    # One task per (file, group, level), as for the full-resolution images
+    tasks = [task for file_config in NC_FILES for task in plan_nc_file(file_config)]
+
+    manifests = {}
+    for task in tasks:
+        folder = task["output_folder"]
+        task["thumbnail_size"] = THUMBNAIL_SIZE
+        for lod in range(1, len(lod_shapes((task["num_lat"], task["num_lon"]), THUMBNAIL_SIZE))):
+            os.makedirs(lod_folder(task, lod), exist_ok=True)
+        if folder not in manifests:
+            manifests[folder] = {} if FORCE else load_manifest(folder)
+            print(f"Saved LOD index: {write_lods_index(task)}")
+        task["previous"] = manifests[folder].get(lods_name(task))
+
+    print(f"\nEncoding LODs of {len(tasks)} levels with {WORKERS} workers...")
+    if WORKERS > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS) as executor:
+            results = list(executor.map(encode_level_lods, tasks))
+    else:
+        results = [encode_level_lods(task) for task in tasks]
+
+    folders = {}
+    for task, (log, entry) in zip(tasks, results):
+        print("\n".join(log))
+        folders.setdefault(task["output_folder"], {})[lods_name(task)] = entry
+    for folder, entries in folders.items():
+        artifacts = load_manifest(folder)
+        artifacts.update(entries)
+        save_manifest(folder, artifacts)
+
+if __name__ == "__main__":
+    main()
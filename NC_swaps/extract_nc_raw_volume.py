@@ -0,0 +1,122 @@
+import netCDF4 as nc
+import numpy as np
+import os
+from extract_nc_all_levels_params_to_imgs import LEVEL_GROUPS, NC_FILES, SCRIPT_DIR, read_group_grid, read_origin
+from nc_levels import read_filled
+from raw_volume import create_raw_volume, int16_quantization, open_raw_volume, read_level, write_level
+
+# Writes one raw binary volume per NetCDF file, an alternative to the PNG level
+# images that a client can memory-map and upload as 3D textures without decoding
+# (layout in raw_volume.py and README-encoding.md)
+OUTPUT_FOLDER = os.path.join(SCRIPT_DIR, 'raw_volumes')
+
+# 'float16': values as half floats (NaN where missing);
+# 'int16': quantized per group and channel with the scale/offset in the header
+VOLUME_DTYPE = 'float16'
+
+# Channels of every point; altitude is the level's altitude, like the A channel of the images
+CHANNELS = ('u', 'v', 'w', 'altitude')
+
+def read_level_values(ds, var_names, k, altitude):
+    """(y, x, channel) float32 array of level k, masked values as NaN"""
+    fields = [read_filled(ds, name, k) for name in var_names]
+    values = np.empty(fields[0].shape + (len(CHANNELS),), dtype=np.float32)
+    for c, field in enumerate(fields):
+        values[..., c] = field
+    values[..., len(fields)] = altitude
+    return values
+
+def channel_ranges(ds, var_names, altitudes):
+    """(min, max) of every channel over all levels, read one level at a time"""
+    ranges = [(np.inf, -np.inf)] * len(var_names)
+    for k in range(len(altitudes)):
+        for c, name in enumerate(var_names):
+            field = read_filled(ds, name, k)
+            if np.isnan(field).all():
+                continue
+            vmin, vmax = ranges[c]
+            ranges[c] = (min(vmin, float(np.nanmin(field))), max(vmax, float(np.nanmax(field))))
+    ranges = [(vmin, vmax) if vmin <= vmax else (0.0, 0.0) for vmin, vmax in ranges]
+    return ranges + [(min(altitudes), max(altitudes))]
+
+def fill_volume(ds, path, groups, dtype, attrs, group_vars):
+    """Create the volume file and fill it one level at a time, so memory stays at one level"""
+    header, sections = create_raw_volume(path, groups, dtype, attrs)
+    for entry in header["groups"]:
+        group = entry["group"]
+        print(f"  {group}: {entry['shape'][0]} levels of {entry['shape'][1]} x {entry['shape'][2]}")
+        for k, altitude in enumerate(entry["altitudes"]):
+            write_level(header, sections, group, k, read_level_values(ds, group_vars[group], k, altitude))
+        data, mask = sections[group]
+        data.flush()
+        mask.flush()
+
+def export_nc_file(file_config, dtype=VOLUME_DTYPE):
+    """Write the raw volume of one NetCDF file; returns its path, or None if the file is missing"""
+    nc_path = file_config['path']
+    print(f"\n=== Exporting {file_config['name'].upper()} file ===")
+    if not os.path.exists(nc_path):
+        print(f"Warning: File not found: {nc_path}")
+        return None
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    out_path = os.path.join(OUTPUT_FOLDER, f"{file_config['output_prefix']}_volume.bytes")
+    with nc.Dataset(nc_path) as ds:
+        lat_origin, lon_origin = read_origin(ds)
+        groups = []
+        group_vars = {}
+        for group, u_name, v_name, w_name, alt_name, lat_name, lon_name in LEVEL_GROUPS:
+            required_vars = [u_name, v_name, w_name, lat_name, lon_name, alt_name]
+            missing_vars = [var for var in required_vars if var not in ds.variables]
+            if missing_vars:
+                print(f"  Skipping {group}: Missing variables {missing_vars}")
+                continue
+            grid = read_group_grid(ds, group, lat_name, lon_name, alt_name)
+            entry = {
+                "group": group,
+                "shape": [len(grid["altitudes"]), grid["num_lat"], grid["num_lon"]],
+                "channels": list(CHANNELS),
+                **grid,
+            }
+            if dtype == 'int16':
+                quantization = [int16_quantization(vmin, vmax)
+                                for vmin, vmax in channel_ranges(ds, (u_name, v_name, w_name), grid["altitudes"])]
+                entry["scale"] = [scale for scale, _ in quantization]
+                entry["offset"] = [offset for _, offset in quantization]
+            groups.append(entry)
+            group_vars[group] = (u_name, v_name, w_name)
+        if not groups:
+            return None
+
+        attrs = {"source": os.path.basename(nc_path), "lat_origin": lat_origin, "lon_origin": lon_origin}
+        fill_volume(ds, out_path + ".part", groups, dtype, attrs, group_vars)
+    os.replace(out_path + ".part", out_path)
+    print(f"  Saved: {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+    return out_path
+
+def verify_volume(out_path, nc_path):
+    """Read the volume back through np.memmap and compare every level with the NetCDF file"""
+    header, sections = open_raw_volume(out_path)
+    group_vars = {g[0]: g[1:4] for g in LEVEL_GROUPS}
+    with nc.Dataset(nc_path) as ds:
+        for entry in header["groups"]:
+            group = entry["group"]
+            max_err = np.zeros(len(CHANNELS))
+            for k, altitude in enumerate(entry["altitudes"]):
+                expected = read_level_values(ds, group_vars[group], k, altitude)
+                values = read_level(header, sections, group, k)
+                expected_valid = ~np.isnan(expected).any(axis=-1)
+                if not np.array_equal(expected_valid, ~np.isnan(values).any(axis=-1)):
+                    raise ValueError(f"Validity mask of {group} level {k} doesn't match {nc_path}")
+                max_err = np.maximum(max_err, np.abs(values - expected)[expected_valid].max(axis=0, initial=0))
+            errors = ", ".join(f"{name} {err:.4g}" for name, err in zip(CHANNELS, max_err))
+            print(f"  Verified {group}: max abs error {errors}")
+
+def main():
+    for file_config in NC_FILES:
+        out_path = export_nc_file(file_config)
+        if out_path:
+            verify_volume(out_path, file_config['path'])
+
+if __name__ == "__main__":
+    main()
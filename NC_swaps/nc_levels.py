@@ -0,0 +1,93 @@
+import netCDF4 as nc
+import numpy as np
+
+# Level-at-a-time access to the case NetCDF files (OpenFOAM, HRRR-regrid and
+# difference), whose variables are named {param}_{group} with dimensions
+# (altitude, latitude, longitude). Only one (group, level) slice is in memory
+# at a time, so peak memory doesn't grow with the number of levels.
+GROUPS = ('low', 'mid', 'high')
+WIND_PARAMS = ('u', 'v', 'w')
+
+
+def read_filled(ds, name, index=slice(None)):
+    """A variable, or a slice of it (e.g. one level), as a float array with masked values as NaN"""
+    values = ds.variables[name][index]
+    return np.ma.filled(values.astype(np.result_type(values.dtype, np.float32)), np.nan)
+
+
+def iter_slices(ds, name):
+    """A variable one level at a time (its first index) if it is 3D, else all of it at once"""
+    if ds.variables[name].ndim < 3:
+        yield read_filled(ds, name)
+        return
+    for k in range(ds.variables[name].shape[0]):
+        yield read_filled(ds, name, k)
+
+
+def group_levels(ds, group):
+    """Altitudes of a group's levels"""
+    return read_filled(ds, f'altitude_{group}')
+
+
+def has_group(ds, group, params=WIND_PARAMS):
+    return all(f'{param}_{group}' in ds.variables for param in params) and f'altitude_{group}' in ds.variables
+
+
+def iter_levels(ds, group, params=WIND_PARAMS):
+    """Yield (k, altitude, {param: 2D (lat, lon) array}) for every level of a group, one level at a time"""
+    for k, altitude in enumerate(group_levels(ds, group)):
+        yield k, float(altitude), {param: read_filled(ds, f'{param}_{group}', k) for param in params}
+
+
+def iter_group_levels(path, groups=GROUPS, params=WIND_PARAMS):
+    """Yield (group, k, altitude, fields) over all levels of all groups of a NetCDF file that has them"""
+    with nc.Dataset(path) as ds:
+        for group in groups:
+            if has_group(ds, group, params):
+                for k, altitude, fields in iter_levels(ds, group, params):
+                    yield group, k, altitude, fields
+
+
+def nearest_index(coord, value):
+    """Index of the coordinate value nearest to value (for 1D coordinate variables)"""
+    return int(np.abs(np.asarray(coord) - value).argmin())
+
+
+class RunningStats:
+    """NaN-ignoring min/max/mean of values that arrive one slice at a time"""
+
+    def __init__(self):
+        self.min = np.inf
+        self.max = -np.inf
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, values):
+        valid = values[~np.isnan(values)]
+        if valid.size:
+            self.min = min(self.min, float(valid.min()))
+            self.max = max(self.max, float(valid.max()))
+            self.total += float(valid.sum(dtype=np.float64))
+            self.count += valid.size
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+
+class RunningRMSE:
+    """RMSE over the points where both arrays are valid, accumulated one slice at a time"""
+
+    def __init__(self):
+        self.sum_sq = 0.0
+        self.count = 0
+
+    def add(self, a, b):
+        mask = ~np.isnan(a) & ~np.isnan(b)
+        diff = a[mask].astype(np.float64) - b[mask]
+        self.sum_sq += float(np.dot(diff, diff))
+        self.count += diff.size
+
+    @property
+    def value(self):
+        return np.sqrt(self.sum_sq / self.count) if self.count else np.nan
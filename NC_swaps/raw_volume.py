@@ -0,0 +1,137 @@
+import json
+import numpy as np
+
+# Raw volume file layout (all little-endian, every section starts on an ALIGN-byte boundary):
+#   magic (8 bytes) | version (uint32) | JSON header length (uint32) | JSON header | padding
+#   per group: data (level, y, x, channel) float16 or int16 | validity bits (level, ceil(y*x/8)) uint8
+# The JSON header holds the byte offset of every section, so a client can map
+# or upload each group's data directly as a 3D texture (RGBAHalf / RGBA16_SNorm).
+MAGIC = b"TRU4DVOL"
+VERSION = 1
+ALIGN = 64
+# int16 value of missing points; valid points are quantized into -32767..32767
+MISSING_INT16 = -32768
+DTYPES = {"float16": "<f2", "int16": "<i2"}
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def mask_bytes_per_level(shape):
+    """Bytes of validity bits per level; each level's bits start on a new byte."""
+    _, ny, nx = shape
+    return -(-ny * nx // 8)
+
+
+def int16_quantization(vmin, vmax):
+    """(scale, offset) mapping [vmin, vmax] onto -32767..32767: value = q * scale + offset."""
+    if not vmax > vmin:
+        return 1.0, float(vmin)
+    return (vmax - vmin) / 65534, (vmax + vmin) / 2
+
+
+def create_raw_volume(path, groups, dtype="float16", attrs=None):
+    """Lay out a raw volume file and return (header, sections), memory-mapped for writing.
+
+    groups is a list of dicts, each with "group", "shape" (levels, y, x),
+    "channels" (names) and any extra fields for the JSON header; for int16
+    they also need "scale" and "offset" per channel (int16_quantization()).
+    sections maps each group name to its (data, mask) memmaps. Fill them with
+    write_level() and flush them before renaming path + ".part" into place.
+    """
+    header = {"version": VERSION, "dtype": dtype, "byte_order": "little", "missing_int16": MISSING_INT16,
+              **(attrs or {}), "groups": []}
+    itemsize = np.dtype(DTYPES[dtype]).itemsize
+    # The data starts after the JSON, whose length depends on the data offsets it
+    # holds: move the data start back until the JSON fits in front of it
+    data_start = 0
+    header_bytes = b""
+    while 16 + len(header_bytes) > data_start:
+        data_start = _align(16 + len(header_bytes))
+        offset = data_start
+        header["groups"] = []
+        for group in groups:
+            shape = [int(n) for n in group["shape"]]
+            data_bytes = int(np.prod(shape)) * len(group["channels"]) * itemsize
+            mask_bytes = shape[0] * mask_bytes_per_level(shape)
+            header["groups"].append({
+                **group, "shape": shape,
+                "data_offset": offset, "data_bytes": data_bytes,
+                "mask_offset": _align(offset + data_bytes), "mask_bytes": mask_bytes,
+            })
+            offset = _align(_align(offset + data_bytes) + mask_bytes)
+        header_bytes = json.dumps(header).encode()
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([VERSION, len(header_bytes)], dtype="<u4").tobytes())
+        f.write(header_bytes.ljust(data_start - 16))
+        f.truncate(offset)
+    return header, _map_sections(path, header, "r+")
+
+
+def _map_sections(path, header, mode):
+    sections = {}
+    for group in header["groups"]:
+        shape = tuple(group["shape"])
+        data = np.memmap(path, dtype=DTYPES[header["dtype"]], mode=mode, offset=group["data_offset"],
+                         shape=shape + (len(group["channels"]),))
+        mask = np.memmap(path, dtype=np.uint8, mode=mode, offset=group["mask_offset"],
+                         shape=(shape[0], mask_bytes_per_level(shape)))
+        sections[group["group"]] = (data, mask)
+    return sections
+
+
+def write_level(header, sections, group_name, k, values):
+    """Store level k of a group from a (y, x, channel) float array with NaN where data is missing.
+
+    A point is valid if none of its channels is NaN. float16 volumes keep NaN
+    at invalid points; int16 volumes store MISSING_INT16 there.
+    """
+    group = next(g for g in header["groups"] if g["group"] == group_name)
+    data, mask = sections[group_name]
+    valid = ~np.isnan(values).any(axis=-1)
+    if header["dtype"] == "int16":
+        scale = np.asarray(group["scale"], dtype=np.float64)
+        offset = np.asarray(group["offset"], dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            q = np.clip(np.rint((values - offset) / scale), -32767, 32767).astype(np.int16)
+        q[~valid] = MISSING_INT16
+        data[k] = q
+    else:
+        level = values.astype(np.float16)
+        level[~valid] = np.nan
+        data[k] = level
+    mask[k] = np.packbits(valid.ravel(), bitorder="little")
+
+
+def read_header(path):
+    """JSON header of a raw volume file."""
+    with open(path, "rb") as f:
+        magic = f.read(8)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a raw volume file")
+        version, json_len = np.frombuffer(f.read(8), dtype="<u4")
+        if version > VERSION:
+            raise ValueError(f"{path} has raw volume version {version}, newer than {VERSION}")
+        return json.loads(f.read(int(json_len)))
+
+
+def open_raw_volume(path):
+    """(header, sections) of a raw volume file, memory-mapped read-only; nothing is read until sliced."""
+    header = read_header(path)
+    return header, _map_sections(path, header, "r")
+
+
+def read_level(header, sections, group_name, k):
+    """Level k of a group as a (y, x, channel) float32 array with NaN where the validity bit is 0."""
+    group = next(g for g in header["groups"] if g["group"] == group_name)
+    data, mask = sections[group_name]
+    _, ny, nx = group["shape"]
+    values = np.asarray(data[k], dtype=np.float32)
+    if header["dtype"] == "int16":
+        values = values * np.asarray(group["scale"], dtype=np.float32) + np.asarray(group["offset"], dtype=np.float32)
+    valid = np.unpackbits(mask[k], count=ny * nx, bitorder="little").reshape(ny, nx).astype(bool)
+    values[~valid] = np.nan
+    return values
@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../HRRR"))
+from image_encoding import encode_rgba, encode_rgba16, join_hi_lo, normalize, split_hi_lo
+
+# Benchmark the 8-bit and 16-bit (hi/lo PNG pair) texture encodings on a
+# synthetic low-group level: encode time, PNG size and quantization error
+
+NUM_LAT, NUM_LON = 231, 211  # low-level grid of the Elizabethtown NC files
+REPEATS = 20
+
+
+def synthetic_level(seed=0):
+    """Smooth u/v/w fields with some noise and a few missing points, like a CFD-minus-HRRR difference."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:1:NUM_LAT * 1j, 0:1:NUM_LON * 1j]
+    u = (3 * np.sin(4 * x) * np.cos(3 * y) + 0.05 * rng.normal(size=x.shape)).astype(np.float32)
+    v = (3 * np.cos(5 * x + y) + 0.05 * rng.normal(size=x.shape)).astype(np.float32)
+    w = (0.5 * np.sin(7 * y) * np.sin(6 * x) + 0.01 * rng.normal(size=x.shape)).astype(np.float32)
+    for field in (u, v, w):
+        field[rng.random(field.shape) < 0.001] = np.nan
+    return u, v, w
+
+
+def png_bytes(rgba):
+    buf = io.BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def time_it(func):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = func()
+    return (time.perf_counter() - start) / REPEATS, result
+
+
+def main():
+    u, v, w = synthetic_level()
+    (u_norm, u_min, u_max), (v_norm, _, _), (w_norm, _, _) = normalize(u), normalize(v), normalize(w)
+    valid = ~(np.isnan(u) | np.isnan(v) | np.isnan(w))
+    alt_norm = 0.5
+
+    t8, rgba8 = time_it(lambda: encode_rgba(u_norm, v_norm, w_norm, alt_norm, valid))
+    t16, rgba16 = time_it(lambda: encode_rgba16(u_norm, v_norm, w_norm, alt_norm, valid))
+    tpng8, png8 = time_it(lambda: png_bytes(rgba8))
+    tpng16, png16 = time_it(lambda: [png_bytes(image) for image in split_hi_lo(rgba16)])
+
+    # Decoded u vs the original, on valid points
+    assert np.array_equal(join_hi_lo(*split_hi_lo(rgba16)), rgba16)
+    u_range = float(u_max - u_min)
+    err8 = np.abs(rgba8[..., 0][valid] / 255 * u_range + u_min - u[valid])
+    err16 = np.abs(rgba16[..., 0][valid] / 65535 * u_range + u_min - u[valid])
+
+    print(f"Level {NUM_LAT}x{NUM_LON}, u range {u_range:.3f} m/s, mean of {REPEATS} runs")
+    print(f"{'':8}{'encode':>10}{'png':>10}{'size':>12}{'u step':>12}{'max u err':>12}")
+    print(f"{'8-bit':8}{t8 * 1000:>8.2f}ms{tpng8 * 1000:>8.2f}ms{len(png8):>10} B"
+          f"{u_range / 255 * 100:>9.3f}cm/s{err8.max() * 100:>9.3f}cm/s")
+    print(f"{'16-bit':8}{t16 * 1000:>8.2f}ms{tpng16 * 1000:>8.2f}ms{sum(map(len, png16)):>10} B"
+          f"{u_range / 65535 * 100:>9.4f}cm/s{err16.max() * 100:>9.4f}cm/s")
+    print(f"16-bit PNG pair is {sum(map(len, png16)) / len(png8):.2f}x the 8-bit size")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import netCDF4 as nc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "NC_swaps"))
+import extract_nc_chunk_store
+from chunk_store import read_index, read_subvolume
+
+# Check that extract_nc_chunk_store.py stores float32 and float64 NetCDF files
+# (the OpenFOAM files are float32, generate_hrrr_netcdf.py writes float64) in
+# their own dtype, so every level reads back exactly, NaN and empty chunks included.
+
+NUM_ALT, NUM_LAT, NUM_LON = 3, 100, 70
+
+
+def write_case(path, dtype):
+    """A one-group ('low') case file with NaN below the terrain and an all-NaN corner tile"""
+    rng = np.random.default_rng(0)
+    with nc.Dataset(path, 'w') as ds:
+        setattr(ds, 'origin for x,y meters', '[ 33.0265 -97.2725]')
+        ds.createDimension('altitude_low', NUM_ALT)
+        ds.createDimension('latitude_low', NUM_LAT)
+        ds.createDimension('longitude_low', NUM_LON)
+        dims = ('altitude_low', 'latitude_low', 'longitude_low')
+        ds.createVariable('altitude_low', dtype, dims[:1])[:] = [400.0, 420.0, 440.0]
+        ds.createVariable('latitude_low', dtype, dims[1:2])[:] = np.linspace(32.99, 33.06, NUM_LAT)
+        ds.createVariable('longitude_low', dtype, dims[2:])[:] = np.linspace(-97.3, -97.25, NUM_LON)
+        ds.createVariable('x_from_origin_low', dtype, dims[2:])[:] = np.linspace(-2000.0, 2000.0, NUM_LON)
+        ds.createVariable('y_from_origin_low', dtype, dims[1:2])[:] = np.linspace(-3000.0, 3000.0, NUM_LAT)
+        for param in ('u', 'v', 'w'):
+            values = rng.normal(0.0, 5.0, (NUM_ALT, NUM_LAT, NUM_LON))
+            # Differs from values[..., 1] only beyond float32 precision
+            values[..., 0] = values[..., 1] + 1e-12
+            values[1, 10:20, 10:20] = np.nan
+            values[0, :64, :64] = np.nan
+            var = ds.createVariable(f'{param}_low', dtype, dims, fill_value=np.nan)
+            var.units = 'm/s'
+            var[:] = values
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        extract_nc_chunk_store.OUTPUT_FOLDER = folder
+        for dtype in ('f4', 'f8'):
+            path = os.path.join(folder, f'case_{dtype}.nc')
+            write_case(path, dtype)
+            out_dir = extract_nc_chunk_store.export_nc_file({'name': dtype, 'output_prefix': dtype, 'path': path})
+            extract_nc_chunk_store.verify_store(out_dir, path)
+
+            index = read_index(out_dir)
+            variables = index["groups"]["low"]["variables"]
+            stored = {entry["dtype"] for entry in variables.values()}
+            if stored != {f'<{dtype}'}:
+                raise AssertionError(f"{dtype} source stored as {stored}")
+            if '0.0.0' not in variables['u']["empty_chunks"]:
+                raise AssertionError("All-NaN chunk 0.0.0 of u was written")
+            tile = read_subvolume(out_dir, 'low', 'u', (1, slice(0, 64), slice(0, 2)), index)
+            with nc.Dataset(path) as ds:
+                expected = ds.variables['u_low'][1, :64, :2].filled(np.nan)
+            if tile.dtype != expected.dtype or not np.array_equal(tile, expected, equal_nan=True):
+                raise AssertionError(f"{dtype} tile doesn't match the source")
+            print(f"OK {dtype}: {sorted(variables)} stored as <{dtype}")
+
+
+if __name__ == "__main__":
+    main()
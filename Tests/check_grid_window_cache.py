@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "HRRR"))
+from hrrr_grid import LambertGrid, bbox_window
+
+# Check that LambertGrid.bbox_window() returns the same full-grid window and mask
+# when computed, when taken from the in-memory cache and when reloaded from disk,
+# and that they match bbox_window() on the full lat/lon arrays.
+
+# HRRR CONUS grid definition (the GRIB2 keys of grid_from_message())
+HRRR_CONUS = {
+    "Nx": 1799, "Ny": 1059,
+    "latitudeOfFirstGridPointInDegrees": 21.138123, "longitudeOfFirstGridPointInDegrees": 237.280472,
+    "LaDInDegrees": 38.5, "LoVInDegrees": 262.5, "Latin1InDegrees": 38.5, "Latin2InDegrees": 38.5,
+    "DxInMetres": 3000.0, "DyInMetres": 3000.0,
+    "iScansNegatively": 0, "jScansPositively": 1,
+    "radius": 6371229.0,
+}
+
+# (lon_min, lat_min, lon_max, lat_max)
+BBOXES = [
+    (-97.648, 32.742, -96.898, 33.231),  # Fort Worth
+    (-97.3, 32.99, -97.25, 33.06),       # Elizabethtown
+]
+
+
+def same(a, b):
+    return a[0] == b[0] and np.array_equal(a[1], b[1])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        grid = LambertGrid(HRRR_CONUS, cache_dir=cache_dir)
+        lats, lons = grid.latlons()
+        for bbox in BBOXES:
+            expected = bbox_window(lats, lons, bbox)
+            first = grid.bbox_window(bbox)
+            cached = grid.bbox_window(bbox)
+            reloaded = LambertGrid.load(grid.key, cache_dir).bbox_window(bbox)
+            uncached = LambertGrid(HRRR_CONUS, cache_dir=None).bbox_window(bbox)
+            for name, result in (("first", first), ("cached", cached), ("reloaded", reloaded), ("uncached", uncached)):
+                if not same(result, expected):
+                    raise AssertionError(f"{name} window {result[0]} of {bbox} != full-grid window {expected[0]}")
+            print(f"OK {bbox}: rows {expected[0][0].start}:{expected[0][0].stop}, "
+                  f"cols {expected[0][1].start}:{expected[0][1].stop}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,42 @@
-import xarray as xr
+import netCDF4 as nc
 import numpy as np
 import os
+import sys
+
+# Level-at-a-time NetCDF reader shared with the NC_swaps scripts
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../NC_swaps"))
+from nc_levels import GROUPS, WIND_PARAMS, RunningRMSE, RunningStats, iter_slices
 
 OPENFOAM_NC = "NCdata/openfoam_usa-tx-elizabethtown_2023-02-14T15-00-00.nc"
 HRRR_NC = "NCdata/hrrr-regrid_usa-tx-elizabethtown_2023-02-14T15-00-00_f0hr0min.nc"
 
-def print_stats(label, arr):
-    print(f"  {label}: min={np.nanmin(arr):.4f}, max={np.nanmax(arr):.4f}, mean={np.nanmean(arr):.4f}")
+def print_stats(label, stats):
+    print(f"  {label}: min={stats.min:.4f}, max={stats.max:.4f}, mean={stats.mean:.4f}")
 
-def rmse(a, b):
-    mask = ~np.isnan(a) & ~np.isnan(b)
-    if np.any(mask):
-        return np.sqrt(np.nanmean((a[mask] - b[mask])**2))
+def compare_variable(of, hrrr, var_name):
+    """Print stats of a variable in both datasets and their RMSE, reading one level at a time"""
+    of_stats, hrrr_stats, rmse = RunningStats(), RunningStats(), RunningRMSE()
+    of_shape, hrrr_shape = of.variables[var_name].shape, hrrr.variables[var_name].shape
+    if of_shape == hrrr_shape:
+        for of_level, hrrr_level in zip(iter_slices(of, var_name), iter_slices(hrrr, var_name)):
+            of_stats.add(of_level)
+            hrrr_stats.add(hrrr_level)
+            rmse.add(of_level, hrrr_level)
+    else:
+        for ds, stats in ((of, of_stats), (hrrr, hrrr_stats)):
+            for level in iter_slices(ds, var_name):
+                stats.add(level)
+    print_stats("OpenFOAM", of_stats)
+    print_stats("HRRR-regrid", hrrr_stats)
+    if of_shape == hrrr_shape:
+        print(f"  RMSE: {rmse.value:.4f}")
     else:
-        return np.nan
+        print(f"  Shapes differ: OpenFOAM {of_shape}, HRRR {hrrr_shape}")
 
 def extract_origin_from_global_attrs(ds):
-    if 'origin for x,y meters' in ds.attrs:
-        origin = ds.attrs['origin for x,y meters']
+    if 'origin for x,y meters' in ds.ncattrs():
+        origin = ds.getncattr('origin for x,y meters')
         if isinstance(origin, str):
             # Try to parse string format like "[ 33.0265 -97.2725]"
             try:
@@ -41,10 +60,10 @@ def print_origin_info(ds, group):
     # Check variable attributes
     for var_prefix in ['x_from_origin', 'y_from_origin']:
         var_name = f"{var_prefix}_{group}"
-        if var_name in ds:
-            attrs = ds[var_name].attrs
-            if 'lat_origin' in attrs and 'lon_origin' in attrs:
-                print(f"  {var_prefix} origin: lat={attrs['lat_origin']:.6f}, lon={attrs['lon_origin']:.6f}")
+        if var_name in ds.variables:
+            var = ds.variables[var_name]
+            if 'lat_origin' in var.ncattrs() and 'lon_origin' in var.ncattrs():
+                print(f"  {var_prefix} origin: lat={var.lat_origin:.6f}, lon={var.lon_origin:.6f}")
             else:
                 print(f"  {var_prefix} origin attributes not found")
 
@@ -52,8 +71,8 @@ if not (os.path.exists(OPENFOAM_NC) and os.path.exists(HRRR_NC)):
     print("One or both NetCDF files not found.")
     exit(1)
 
-of = xr.open_dataset(OPENFOAM_NC)
-hrrr = xr.open_dataset(HRRR_NC)
+of = nc.Dataset(OPENFOAM_NC)
+hrrr = nc.Dataset(HRRR_NC)
 
 print("=== Origin Information Comparison ===")
 print("\nOpenFOAM Origin Information:")
@@ -77,8 +96,7 @@ if of_lat is not None and hrrr_lat is not None:
     print(f"  lat_diff={lat_diff:.6f}, lon_diff={lon_diff:.6f}")
 
 print("\n=== Group-level Comparison ===")
-groups = ['low', 'mid', 'high']
-for group in groups:
+for group in GROUPS:
     print(f"\n=== {group.upper()} LEVELS ===")
     
     print("\nOpenFOAM:")
@@ -87,33 +105,12 @@ for group in groups:
     print("\nHRRR-regrid:")
     print_origin_info(hrrr, group)
     
-    for var in ['u', 'v', 'w']:
-        of_var = f"{var}_{group}"
-        hrrr_var = f"{var}_{group}"
-        if of_var in of and hrrr_var in hrrr:
-            print(f"\n{of_var}:")
-            print_stats("OpenFOAM", of[of_var].values)
-            print_stats("HRRR-regrid", hrrr[hrrr_var].values)
-            if of[of_var].shape == hrrr[hrrr_var].shape:
-                rmse_val = rmse(of[of_var].values, hrrr[hrrr_var].values)
-                print(f"  RMSE: {rmse_val:.4f}")
-            else:
-                print(f"  Shapes differ: OpenFOAM {of[of_var].shape}, HRRR {hrrr[hrrr_var].shape}")
-        else:
-            print(f"  Variable {of_var} or {hrrr_var} not found in datasets.")
-    
-    for var in ['x_from_origin', 'y_from_origin']:
+    for var in list(WIND_PARAMS) + ['x_from_origin', 'y_from_origin']:
         of_var = f"{var}_{group}"
         hrrr_var = f"{var}_{group}"
-        if of_var in of and hrrr_var in hrrr:
+        if of_var in of.variables and hrrr_var in hrrr.variables:
             print(f"\n{of_var}:")
-            print_stats("OpenFOAM", of[of_var].values)
-            print_stats("HRRR-regrid", hrrr[hrrr_var].values)
-            if of[of_var].shape == hrrr[hrrr_var].shape:
-                rmse_val = rmse(of[of_var].values, hrrr[hrrr_var].values)
-                print(f"  RMSE: {rmse_val:.4f}")
-            else:
-                print(f"  Shapes differ: OpenFOAM {of[of_var].shape}, HRRR {hrrr[hrrr_var].shape}")
+            compare_variable(of, hrrr, of_var)
         else:
             print(f"  Variable {of_var} or {hrrr_var} not found in datasets.")
 
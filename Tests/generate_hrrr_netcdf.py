@@ -7,11 +7,17 @@ for comparison purposes.
 
 import numpy as np
 import xarray as xr
-import pygrib
 import os
+import sys
 from scipy.interpolate import RegularGridInterpolator
 from datetime import datetime, timezone
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../HRRR"))
+from derived_fields import omega_to_w
+from grib_cache import resolve_grib_path
+from grib_index import iter_param_messages
+from hrrr_extract import extract_window_levels
+
 # Configuration
 GRIB_FILE = os.path.join(os.path.dirname(__file__), "../HRRRdata_nat_single/hrrr.t13z.wrfnatf02.grib2")
 OUTPUT_FILE = os.path.join(os.path.dirname(__file__), "../NCdata/hrrr-regrid_usa-tx-elizabethtown_2023-02-14T15-00-00_f0hr0min.nc")
@@ -30,54 +36,42 @@ MID_LEVELS_LON = 43
 HIGH_LEVELS_LAT = 24
 HIGH_LEVELS_LON = 22
 
+# Source window around the target domain, padded so the interpolator has
+# HRRR points on every side (HRRR spacing is ~3 km, ~0.03 deg)
+SOURCE_PAD_DEG = 0.1
+SOURCE_BBOX = (TARGET_LON_MIN - SOURCE_PAD_DEG, TARGET_LAT_MIN - SOURCE_PAD_DEG,
+               TARGET_LON_MAX + SOURCE_PAD_DEG, TARGET_LAT_MAX + SOURCE_PAD_DEG)
+
 # Altitude levels (matching OpenFOAM structure)
 LOW_LEVELS = 15  # levels 1-15
 MID_LEVELS = 3   # levels 16-18
 HIGH_LEVELS = 4  # levels 19-22
 
 print("Loading GRIB data...")
-if not os.path.exists(GRIB_FILE):
-    raise FileNotFoundError(f"GRIB file not found: {GRIB_FILE}")
-
-# Extract data from GRIB file
-levels_data = {}
-lat_grib = None
-lon_grib = None
-
-with pygrib.open(GRIB_FILE) as grbs:
-    for grb in grbs:
-        param = grb.shortName
-        level = grb.level
-        
-        if param in ['u', 'v', 'w', 'gh', 'pres', 't']:
-            if level not in levels_data:
-                levels_data[level] = {}
-            
-            values = grb.values
-            if hasattr(values, 'filled'):
-                values = values.filled(np.nan)
-            
-            levels_data[level][param] = values
-            
-            # Get lat/lon arrays (same for all fields)
-            if lat_grib is None:
-                lat_grib, lon_grib = grb.latlons()
+# Falls back to the latest matching file in the GRIB cache
+GRIB_FILE = resolve_grib_path(GRIB_FILE)
+
+# Extract data from GRIB file, keeping only the source window of each field.
+# Decoded serially: this script runs at module level, which a process pool
+# on spawn-based platforms would re-execute in every worker.
+levels_data, window, _, lat_grib, lon_grib = extract_window_levels(
+    GRIB_FILE, ['u', 'v', 'w', 'gh', 'pres', 't'], SOURCE_BBOX, workers=1)
 
 print(f"Found data for levels: {sorted(levels_data.keys())}")
 
-# Convert w from pressure velocity to geometric velocity
-R_d = 287.05  # J/kg·K (specific gas constant for dry air)
-g = 9.81      # m/s² (gravitational acceleration)
+# Altitude of each level: mean geopotential height over the full CONUS field,
+# not just the source window. Only gh is decoded for this, one message at a time.
+level_altitudes = {grb.level: float(np.mean(grb.values)) for grb in iter_param_messages(GRIB_FILE, ['gh'])}
 
+# Convert w from pressure velocity to geometric velocity
 for level in levels_data:
     if all(param in levels_data[level] for param in ['w', 't', 'pres']):
         omega = levels_data[level]['w']  # Pa/s
         T = levels_data[level]['t']      # K
         p = levels_data[level]['pres']   # Pa
         
-        # Calculate geometric vertical velocity: w = -(omega * R_d * T) / (p * g)
-        w_geom = -(omega * R_d * T) / (p * g)
-        levels_data[level]['w'] = w_geom
+        # Overwrite omega in place with w = -(omega * R_d * T) / (p * g)
+        levels_data[level]['w'] = omega_to_w(omega, T, p, out=omega)
 
 # Select valid levels with all required data
 valid_levels = []
@@ -156,9 +150,9 @@ hrrr_data_3d = {'u': [], 'v': [], 'w': []}
 
 for level in valid_levels:  # Use all valid levels for interpolation
     if level in levels_data and 'gh' in levels_data[level]:
-        # HRRR geopotential height is already in geopotential meters (gpm) = meters MSL
-        gh_mean = np.mean(levels_data[level]['gh'])
-        altitude = gh_mean  # Already in meters above MSL
+        # HRRR geopotential height is already in geopotential meters (gpm) = meters MSL;
+        # full-field mean from level_altitudes, as the source window is only ~0.2 deg wide
+        altitude = level_altitudes[level]  # Already in meters above MSL
         hrrr_altitudes.append(altitude)
         
         # Store 3D data for interpolation
@@ -194,19 +188,16 @@ for i, level in enumerate(valid_levels[:22]):  # Take first 22 levels to match s
         group = 'low'
         idx = level_count['low']
         target_lat, target_lon = output_data['low']['lat'], output_data['low']['lon']
-        target_altitude = actual_altitudes['low'][idx]
     elif i < LOW_LEVELS + MID_LEVELS:
         group = 'mid'
         idx = level_count['mid']
         target_lat, target_lon = output_data['mid']['lat'], output_data['mid']['lon']
-        target_altitude = actual_altitudes['mid'][idx]
     else:
         group = 'high'
         idx = level_count['high']
         target_lat, target_lon = output_data['high']['lat'], output_data['high']['lon']
-        target_altitude = actual_altitudes['high'][idx]
     
-    print(f"Processing level {level} → {group}[{idx}] at {target_altitude:.1f}m MSL (actual GRIB altitude)")
+    print(f"Processing level {level} → {group}[{idx}] at {level_altitudes[level]:.1f}m MSL (actual GRIB altitude)")
     
     # Interpolate each wind component
     for param in ['u', 'v', 'w']: